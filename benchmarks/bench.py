@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Micro benchmarks for the request/response hot path.
+
+All benchmarks call a :class:`bottle.Bottle` application in-process through
+its WSGI interface with synthetic environ dictionaries, so no server, socket
+or client overhead is measured. Results are printed as a table, and can be
+saved as JSON and compared against a previously saved baseline::
+
+    python benchmarks/bench.py --save baseline.json
+    ... change something ...
+    python benchmarks/bench.py --compare baseline.json
+
+For each benchmark, the script reports requests per second (best of several
+rounds) and ``peak_bytes``, the peak of the memory traced by :mod:`tracemalloc`
+while handling a single request, relative to the memory in use before. This
+is a size in bytes, not a number of allocations. Memory that CPython serves
+from its internal free lists is not traced, so small differences are noise.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bottle
+
+
+def make_environ(path, method='GET', body=b'', headers=None):
+    """ Return a minimal but complete WSGI environ dictionary. """
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if body and 'CONTENT_LENGTH' not in (headers or {}):
+        environ['CONTENT_LENGTH'] = str(len(body))
+    environ.update(headers or {})
+    return environ
+
+
+def start_response(status, headerlist, exc_info=None):
+    pass
+
+
+class Benchmark:
+    """ A single benchmark: An application and the environ of one request.
+        The request body (if any) is rewound before each call. """
+
+    def __init__(self, name, app, environ):
+        self.name = name
+        self.app = app
+        self.environ = environ
+        self.body = environ['wsgi.input'].getvalue()
+
+    def __call__(self):
+        environ = self.environ.copy()
+        environ['wsgi.input'] = BytesIO(self.body)
+        out = self.app(environ, start_response)
+        for chunk in out:
+            pass
+        if hasattr(out, 'close'):
+            out.close()
+
+    def check(self):
+        """ Make sure the request actually succeeds (2xx or 3xx status). """
+        status = []
+        environ = self.environ.copy()
+        environ['wsgi.input'] = BytesIO(self.body)
+        out = self.app(environ, lambda s, h, e=None: status.append(s))
+        b''.join(out)
+        if hasattr(out, 'close'):
+            out.close()
+        if not status or status[0][0] not in '23':
+            raise AssertionError('%s: Unexpected status %r' % (self.name, status))
+
+
+def bench_hello():
+    app = bottle.Bottle()
+    app.route('/hello', callback=lambda: 'Hello World!')
+    return make_environ('/hello'), app
+
+
+def bench_json():
+    app = bottle.Bottle()
+    data = {'id': 1, 'name': 'bottle', 'tags': ['fast', 'simple'] * 5,
+            'nested': {'a': 1.5, 'b': None, 'c': True}}
+    app.route('/json', callback=lambda: data)
+    return make_environ('/json'), app
+
+
+SECURITY_HEADERS = {
+    'X-Frame-Options': 'DENY',
+    'X-Content-Type-Options': 'nosniff',
+    'Referrer-Policy': 'same-origin',
+    'Cache-Control': 'no-store',
+    'Strict-Transport-Security': 'max-age=31536000',
+}
+
+
+def bench_headers_hook():
+    """ Common response headers, set by a hook for each response. """
+    app = bottle.Bottle()
+    app.route('/api', callback=lambda: {'ok': True})
+
+    @app.hook('after_request')
+    def add_headers():
+        for name, value in SECURITY_HEADERS.items():
+            bottle.response.set_header(name, value)
+
+    return make_environ('/api'), app
+
+
+def bench_headers_static():
+    """ Same as headers_hook, but with static headers from the config. """
+    app = bottle.Bottle()
+    app.route('/api', callback=lambda: {'ok': True})
+    for name, value in SECURITY_HEADERS.items():
+        app.config['response.headers.' + name.lower().replace('-', '_')] = value
+    return make_environ('/api'), app
+
+
+NOT_MODIFIED_HEADERS = {
+    'ETag': '"abc123"',
+    'Cache-Control': 'max-age=60',
+    'Vary': 'Accept-Encoding',
+}
+
+
+def bench_not_modified():
+    """ A 304 response, built for each request. """
+    app = bottle.Bottle()
+    app.route('/', callback=lambda: bottle.HTTPResponse(
+        status=304, headers=NOT_MODIFIED_HEADERS))
+    return make_environ('/'), app
+
+
+def bench_not_modified_frozen():
+    """ Same as not_modified, but with a frozen response. """
+    app = bottle.Bottle()
+    frozen = bottle.HTTPResponse(status=304, headers=NOT_MODIFIED_HEADERS).freeze()
+    app.route('/', callback=lambda: frozen)
+    return make_environ('/'), app
+
+
+def bench_query():
+    app = bottle.Bottle()
+
+    @app.route('/search')
+    def search():
+        query = bottle.request.query
+        return '%s %s %s' % (query.q, query.get('page', 1, type=int),
+                             len(query.getall('facet')))
+
+    environ = make_environ('/search')
+    environ['QUERY_STRING'] = 'q=bottle+py&page=2&' + '&'.join(
+        'facet=%%5Bf%d%%5D&opt%d=on' % (i, i) for i in range(50))
+    return environ, app
+
+
+def bench_forms():
+    app = bottle.Bottle()
+
+    @app.post('/form')
+    def form():
+        forms = bottle.request.forms
+        return ' '.join(forms.get('field%d' % i) for i in range(20)) + forms.missing
+
+    body = '&'.join('field%d=value+%d' % (i, i) for i in range(20)).encode('ascii')
+    headers = {'CONTENT_TYPE': 'application/x-www-form-urlencoded'}
+    return make_environ('/form', 'POST', body, headers), app
+
+
+def _many_routes(mode):
+    app = bottle.Bottle()
+    app.config['router.mode'] = mode
+    for i in range(500):
+        app.route('/r%d/<name>/<id:int>' % i, callback=lambda name, id: name)
+    return make_environ('/r499/item/42'), app
+
+
+def bench_routes_regex():
+    return _many_routes('regex')
+
+
+def bench_routes_trie():
+    return _many_routes('trie')
+
+
+def bench_multipart():
+    app = bottle.Bottle()
+
+    @app.post('/upload')
+    def upload():
+        upload = bottle.request.files['file']
+        return '%s %d' % (bottle.request.forms['name'], len(upload.file.read()))
+
+    boundary = 'benchmarkboundary'
+    body = ('--%s\r\n'
+            'Content-Disposition: form-data; name="name"\r\n\r\n'
+            'value\r\n'
+            '--%s\r\n'
+            'Content-Disposition: form-data; name="file"; filename="data.bin"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+            % (boundary, boundary)).encode('ascii')
+    body += b'x' * 65536 + ('\r\n--%s--\r\n' % boundary).encode('ascii')
+    headers = {'CONTENT_TYPE': 'multipart/form-data; boundary=%s' % boundary}
+    return make_environ('/upload', 'POST', body, headers), app
+
+
+def make_static_root():
+    root = tempfile.mkdtemp(prefix='bottle-bench-')
+    atexit.register(shutil.rmtree, root, True)
+    with open(os.path.join(root, 'style.css'), 'wb') as fp:
+        fp.write(b'body { color: black; }\n' * 512)
+    return root
+
+
+def bench_static():
+    root = make_static_root()
+    app = bottle.Bottle()
+    app.route('/static/<filename:path>',
+              callback=lambda filename: bottle.static_file(filename, root=root))
+    return make_environ('/static/style.css'), app
+
+
+def bench_static_cached():
+    """ Same as static, with a metadata cache (mtime revalidation). """
+    root, cache = make_static_root(), bottle.StaticCache()
+    app = bottle.Bottle()
+    app.route('/static/<filename:path>', callback=lambda filename:
+              bottle.static_file(filename, root=root, cache=cache))
+    return make_environ('/static/style.css'), app
+
+
+def bench_static_memory():
+    """ Same as static_cached, with the file content cached in memory. """
+    root, cache = make_static_root(), bottle.StaticCache(max_bytes=1024 * 1024)
+    app = bottle.Bottle()
+    app.route('/static/<filename:path>', callback=lambda filename:
+              bottle.static_file(filename, root=root, cache=cache))
+    return make_environ('/static/style.css'), app
+
+
+def bench_static_gzip():
+    """ Same as static_memory, compressed once for gzip-capable clients. """
+    root = make_static_root()
+    cache = bottle.StaticCache(max_bytes=1024 * 1024, compress=True)
+    app = bottle.Bottle()
+    app.route('/static/<filename:path>', callback=lambda filename:
+              bottle.static_file(filename, root=root, cache=cache))
+    headers = {'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br'}
+    return make_environ('/static/style.css', 'GET', b'', headers), app
+
+
+def bench_chunked():
+    app = bottle.Bottle()
+    app.post('/chunked', callback=lambda: str(len(bottle.request.body.read())))
+    chunk = b'x' * 1024
+    body = b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for i in range(64))
+    body += b'0\r\n\r\n'
+    headers = {'HTTP_TRANSFER_ENCODING': 'chunked'}
+    return make_environ('/chunked', 'POST', body, headers), app
+
+
+def bench_template():
+    app = bottle.Bottle()
+    tpl = bottle.SimpleTemplate('<ul>\n'
+                                '% for item in items:\n'
+                                '  <li>{{item["name"]}}: {{item["value"]}}</li>\n'
+                                '% end\n'
+                                '</ul>\n')
+    items = [{'name': 'item%d' % i, 'value': '<%d>' % i} for i in range(50)]
+    app.route('/template', callback=lambda: tpl.render(items=items))
+    return make_environ('/template'), app
+
+
+BENCHMARKS = [
+    ('hello', bench_hello),
+    ('json', bench_json),
+    ('headers_hook', bench_headers_hook),
+    ('headers_static', bench_headers_static),
+    ('not_modified', bench_not_modified),
+    ('not_modified_frozen', bench_not_modified_frozen),
+    ('query', bench_query),
+    ('forms', bench_forms),
+    ('routes_regex', bench_routes_regex),
+    ('routes_trie', bench_routes_trie),
+    ('multipart', bench_multipart),
+    ('static', bench_static),
+    ('static_cached', bench_static_cached),
+    ('static_memory', bench_static_memory),
+    ('static_gzip', bench_static_gzip),
+    ('chunked', bench_chunked),
+    ('template', bench_template),
+]
+
+
+def measure(bench, rounds, min_time):
+    """ Return a dict with the results for a single benchmark. """
+    bench.check()
+    timer = timeit.Timer(bench)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    best = min(timer.repeat(repeat=rounds, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        bench()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        bench()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    return {'rps': round(1.0 / best, 1),
+            'usec': round(best * 1e6, 2),
+            'peak_bytes': peak}
+
+
+def run(names, rounds, min_time, out=sys.stdout):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        environ, app = setup()
+        results[name] = measure(Benchmark(name, app, environ), rounds, min_time)
+        out.write('%-20s %12.1f req/s %10.2f usec %10d peak_bytes\n' % (
+            name, results[name]['rps'], results[name]['usec'],
+            results[name]['peak_bytes']))
+    return {
+        'bottle': bottle.__version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold, out=sys.stdout):
+    """ Print a comparison table and return the names of all benchmarks that
+        are slower than the baseline by more than `threshold` percent. """
+    regressions = []
+    out.write('\n%-20s %12s %12s %8s %12s\n' % (
+        'benchmark', 'base req/s', 'req/s', 'change', 'peak_bytes'))
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if not base:
+            out.write('%-20s %12s %12.1f %8s %12d\n' % (
+                name, '-', result['rps'], 'new', result['peak_bytes']))
+            continue
+        change = (result['rps'] / base['rps'] - 1) * 100
+        flag = ''
+        if change < -threshold:
+            regressions.append(name)
+            flag = '  <- slower'
+        out.write('%-20s %12.1f %12.1f %+7.1f%% %+12d%s\n' % (
+            name, base['rps'], result['rps'], change,
+            result['peak_bytes'] - base['peak_bytes'], flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='benchmarks to run (default: all of %s)'
+                             % ', '.join(name for name, _ in BENCHMARKS))
+    parser.add_argument('--save', metavar='FILE',
+                        help='write results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='report slowdowns above this percentage '
+                             '(default: %(default)s)')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='number of timing rounds (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum duration of a round in seconds '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(name for name, _ in BENCHMARKS)
+    if unknown:
+        parser.error('Unknown benchmark: %s' % ', '.join(sorted(unknown)))
+
+    current = run(args.names, args.rounds, args.min_time)
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(current, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if compare(baseline, current, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -68,14 +68,16 @@ if __name__ == '__main__':
 # Imports and Helpers used everywhere else #####################################
 ###############################################################################
 
-import base64, calendar, email.utils, functools, hmac, itertools, \
+import base64, calendar, contextvars, email.utils, functools, hmac, itertools, \
     mimetypes, os, re, tempfile, threading, time, warnings, weakref, hashlib
 
-from types import FunctionType
+from types import FunctionType, MappingProxyType
+from stat import S_ISREG
 from datetime import date as datedate, datetime, timedelta
 from tempfile import NamedTemporaryFile
 from traceback import format_exc, print_exc
 from unicodedata import normalize
+from uuid import UUID
 
 try:
     from ujson import dumps as json_dumps, loads as json_lds
@@ -89,6 +91,7 @@ import _thread as thread
 from urllib.parse import urljoin, SplitResult as UrlSplitResult
 from urllib.parse import urlencode, quote as urlquote, unquote as urlunquote
 from http.cookies import SimpleCookie, Morsel, CookieError
+from collections import OrderedDict
 from collections.abc import MutableMapping as DictMixin
 from types import ModuleType as new_module
 import pickle
@@ -110,6 +113,13 @@ def _wsgi_recode(src):
     return src.encode('latin1').decode('utf8', 'surrogateescape')
 
 
+def _wsgi_encode(src):
+    """ Translate a utf8+surrogateescape string to a PEP-3333 latin1-string """
+    if src.isascii():
+        return src
+    return src.encode('utf8', 'surrogateescape').decode('latin1')
+
+
 def _raise(*a):
     raise a[0](a[1]).with_traceback(a[2])
 
@@ -258,6 +268,146 @@ def _re_flatten(p):
                   len(m.group(1)) % 2 else m.group(1) + '(?:', p)
 
 
+#: URL argument types that are safe to be shared between requests.
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, frozenset, UUID, type(None))
+
+_UUID_PATTERN = r'[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}'
+
+#: Patterns of the built-in filters that never match a slash.
+_SEGMENT_PATTERNS = ('[^/]+', r'-?\d+', r'-?[\d.]+', _UUID_PATTERN)
+
+
+def _re_segment_safe(p):
+    """ Return true if a (flattened) pattern can never match a slash and
+        is thus safe to be matched against a single path segment. This check
+        is conservative and rejects anything it does not fully understand. """
+    if p in _SEGMENT_PATTERNS:
+        return True
+    # Test each character class directly, ranges (e.g. [!-0]) may span '/'.
+    for cls in _re_char_class.findall(p):
+        try:
+            if re.match(cls, '/'):
+                return False
+        except re.error:
+            return False
+    p = re.sub(r'\\[dws]', '', _re_char_class.sub('', p))
+    return not re.search(r'[/.\\^$\[\]]|\(\?(?!:)', p)
+
+
+_re_char_class = re.compile(r'\[(?:\\.|[^\]\\])*\]')
+
+
+class _TrieNode:
+    __slots__ = ('static', 'dynamic', 'terminal', 'minimum')
+
+    def __init__(self):
+        self.static = {}  # Literal segment -> child node
+        self.dynamic = []  # List of (pattern, matcher, child node) tuples
+        self.terminal = None  # (index, target, getargs) for rules ending here
+        self.minimum = sys.maxsize  # Lowest rule index in this subtree
+
+
+class _RouteTrie:
+    """ Search structure for the dynamic routes of a single request method.
+
+        Rules are split into path segments and stored in a prefix tree with
+        literal segments as dictionary keys and wildcard segments as ordered
+        children with a matcher each. Rules that cannot be split (e.g. because
+        a wildcard may match a slash) are matched with combined regular
+        expressions instead. Just like the regex matcher, the first rule (in
+        insertion order) that matches a path wins. """
+
+    def __init__(self, maxgroups):
+        self.root = _TrieNode()
+        self.maxgroups = maxgroups
+        self.fallback = []  # List of (combined, [(index, target, getargs)])
+
+    @staticmethod
+    def _matcher(pattern):
+        if pattern == '[^/]+':
+            return bool
+        return re.compile(pattern).fullmatch
+
+    def add(self, index, segments, target, getargs):
+        node = self.root
+        node.minimum = min(node.minimum, index)
+        for key, is_literal in segments:
+            if is_literal:
+                child = node.static.get(key)
+                if child is None:
+                    child = node.static[key] = _TrieNode()
+            else:
+                for pattern, _, child in node.dynamic:
+                    if pattern == key: break
+                else:
+                    child = _TrieNode()
+                    node.dynamic.append((key, self._matcher(key), child))
+            node = child
+            node.minimum = min(node.minimum, index)
+        if node.terminal is None or node.terminal[0] > index:
+            node.terminal = (index, target, getargs)
+
+    def add_fallback(self, rules):
+        """ Add a list of (index, flatpat, target, getargs) tuples that are
+            not suitable for the prefix tree. """
+        for x in range(0, len(rules), self.maxgroups):
+            some = rules[x:x + self.maxgroups]
+            combined = '|'.join('(^%s$)' % flatpat for (_, flatpat, _, _) in some)
+            self.fallback.append((re.compile(combined).match,
+                                  [(i, t, g) for (i, _, t, g) in some]))
+
+    def _search(self, node, segments, pos, best):
+        if best and node.minimum >= best[0]:
+            return best
+        if pos == len(segments):
+            terminal = node.terminal
+            if terminal and (not best or terminal[0] < best[0]):
+                return terminal
+            return best
+        segment = segments[pos]
+        child = node.static.get(segment)
+        if child is not None:
+            best = self._search(child, segments, pos + 1, best)
+        for _, matcher, child in node.dynamic:
+            if matcher(segment):
+                best = self._search(child, segments, pos + 1, best)
+        return best
+
+    def _collect(self, node, segments, pos, found):
+        if pos == len(segments):
+            if node.terminal:
+                found.append(node.terminal[1])
+            return
+        segment = segments[pos]
+        child = node.static.get(segment)
+        if child is not None:
+            self._collect(child, segments, pos + 1, found)
+        for _, matcher, child in node.dynamic:
+            if matcher(segment):
+                self._collect(child, segments, pos + 1, found)
+
+    def match_all(self, path):
+        """ Return the targets of all matching rules in the prefix tree. Rules
+            added via :meth:`add_fallback` are not included. """
+        found = []
+        self._collect(self.root, path.split('/'), 0, found)
+        return found
+
+    def match(self, path):
+        """ Return the first matching (index, target, getargs) or None. """
+        best = self._search(self.root, path.split('/'), 0, None)
+        for combined, rules in self.fallback:
+            if best and rules[0][0] > best[0]:
+                break
+            match = combined(path)
+            if match:
+                rule = rules[match.lastindex - 1]
+                if not best or rule[0] < best[0]:
+                    best = rule
+                break
+        return best
+
+
 class Router:
     """ A Router is an ordered collection of route->target pairs. It is used to
         efficiently match WSGI requests against a number of routes and return
@@ -277,23 +427,168 @@ class Router:
     #: than 99 matching groups per regular expression.
     _MAX_GROUPS_PER_PATTERN = 99
 
-    def __init__(self, strict=False):
+    #: Supported search strategies for dynamic routes (see :attr:`mode`).
+    modes = ('regex', 'trie')
+
+    def __init__(self, strict=False, mode='regex', cache_size=0, profile=False):
         self.rules = []  # All rules in order
         self._groups = {}  # index of regexes to find them in dyna_routes
+        self._segments = {}  # Path segments of dynamic rules (for the trie)
+        self._segment_getargs = {}  # Rule -> getargs without regex (for the trie)
         self.builder = {}  # Data structure for the url builder
+        self._builders = {}  # Compiled url builder functions
         self.static = {}  # Search structure for static routes
         self.dyna_routes = {}
         self.dyna_regexes = {}  # Search structure for dynamic routes
+        self.dyna_tries = {}  # Search structure for dynamic routes (trie mode)
+        self._allow_index = ({}, _RouteTrie(1), [])  # Used for 405 responses
+        self._frozen = True  # False if dyna_regexes or dyna_tries are outdated
         #: If true, static routes are no longer checked first.
         self.strict_order = strict
+        self.mode = mode
+        self.cache_size = cache_size
+        self.profile = profile
         self.filters = {
             're': lambda conf: (_re_flatten(conf or self.default_pattern),
                                 None, None),
             'int': lambda conf: (r'-?\d+', int, lambda x: str(int(x))),
             'float': lambda conf: (r'-?[\d.]+', float, lambda x: str(float(x))),
-            'path': lambda conf: (r'.+?', None, None)
+            'path': lambda conf: (r'.+?', None, None),
+            'uuid': lambda conf: (_UUID_PATTERN, UUID, str)
         }
 
+    @property
+    def mode(self):
+        """ The search strategy used for dynamic routes. The default ``regex``
+            mode tests combined regular expressions of up to
+            :attr:`_MAX_GROUPS_PER_PATTERN` rules at a time, which scales
+            linearly with the number of routes. The ``trie`` mode splits rules
+            into path segments and stores them in a prefix tree. Lookup time
+            then depends on the depth of the path instead. Matching order and
+            results are the same in both modes. """
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode not in self.modes:
+            raise RouterUnknownModeError("Unknown router mode: %r" % mode)
+        self._mode = mode
+        self._frozen = False
+
+    @property
+    def cache_size(self):
+        """ Maximum number of entries in the match cache (default: 0, which
+            disables the cache). If enabled, the results of :meth:`match` are
+            remembered for the most recently requested (method, path)
+            combinations and returned without any regular expression or filter
+            being involved. Only successful matches with immutable URL
+            arguments are cached. The cache is cleared each time the router
+            changes. Changing the size clears the cache and its counters. """
+        return self._cache_size
+
+    @cache_size.setter
+    def cache_size(self, size):
+        self._cache_size = max(0, int(size or 0))
+        self._cache = OrderedDict() if self._cache_size else None
+        self.cache_hits = self.cache_misses = 0
+
+    def cache_info(self):
+        """ Return a dict with statistics about the match cache. """
+        return {'hits': self.cache_hits, 'misses': self.cache_misses,
+                'size': len(self._cache or ()), 'maxsize': self._cache_size}
+
+    @property
+    def profile(self):
+        """ If true, collect statistics for each call to :meth:`match` (see
+            :meth:`stats`). This adds some overhead and should not be enabled
+            in production all the time. Enabling the profiler resets all
+            counters. """
+        return self._stats is not None
+
+    @profile.setter
+    def profile(self, enable):
+        self._stats = {'matches': 0, 'chunks': 0, 'time': 0.0,
+                       'errors': {}, 'hits': {}} if enable else None
+        self._frozen = False
+
+    def stats(self):
+        """ Return a dict with statistics collected since the profiler was
+            enabled, or None if :attr:`profile` is off:
+
+            * ``matches``: Number of calls to :meth:`match`.
+            * ``chunks``: Number of combined regular expressions that were
+              tried (in ``trie`` mode, only the fallback expressions).
+            * ``time``: Total time spent in :meth:`match`, in seconds.
+            * ``errors``: Number of failed matches by HTTP status code.
+            * ``hits``: Number of successful matches by target.
+        """
+        if self._stats is None:
+            return None
+        stats = dict(self._stats)
+        stats['errors'] = dict(stats['errors'])
+        stats['hits'] = dict(stats['hits'])
+        return stats
+
+    def report(self):
+        """ Check all routes for common performance problems and return a
+            dict with two lists:
+
+            * ``shadowed``: (method, rule, earlier_rule) tuples for dynamic
+              rules that can never match, because an earlier rule for the
+              same method already matches all their paths.
+            * ``fallback``: (method, rule) tuples for rules that cannot be
+              split into path segments (e.g. because of a ``:path`` wildcard
+              or a complex regular expression) and always need a regular
+              expression search, even in ``trie`` mode.
+
+            The shadow check is conservative. It only reports rules that are
+            shadowed for sure, and may miss more complex cases. """
+        shadowed, fallback = [], []
+        for method, rules in self.dyna_routes.items():
+            checked = []
+            for (rule, flatpat, _, _) in rules:
+                segments = self._segments[flatpat]
+                if segments is None:
+                    fallback.append((method, rule))
+                for (other, other_flatpat) in checked:
+                    if self._shadows(other_flatpat, flatpat):
+                        shadowed.append((method, rule, other))
+                        break
+                checked.append((rule, flatpat))
+        return {'shadowed': shadowed, 'fallback': fallback}
+
+    def _shadows(self, flatpat, other):
+        """ Return true if pattern `flatpat` matches all paths that are
+            matched by pattern `other`. """
+        a, b = self._segments[flatpat], self._segments[other]
+        if b is not None and all(is_literal for (_, is_literal) in b):
+            path = '/'.join(key for (key, _) in b)
+            return re.fullmatch(flatpat, path) is not None
+        if a is None or b is None or len(a) != len(b):
+            return False
+        for (key_a, literal_a), (key_b, literal_b) in zip(a, b):
+            if literal_a:
+                if not literal_b or key_a != key_b:
+                    return False
+            elif literal_b:
+                if not re.fullmatch(key_a, key_b):
+                    return False
+            elif key_a != key_b and (key_a != self.default_pattern
+                                     or re.fullmatch(key_b, '')):
+                return False
+        return True
+
+    def _count_chunk(self, combined):
+        """ Wrap the match method of a combined regular expression to count
+            calls (used if :attr:`profile` is enabled). """
+        stats = self._stats
+
+        def counting_match(path):
+            stats['chunks'] += 1
+            return combined(path)
+
+        return counting_match
+
     def add_filter(self, name, func):
         """ Add a filter. The provided function is called with the configuration
         string as parameter and must return a (regexp, to_python, to_url) tuple.
@@ -326,13 +621,97 @@ class Router:
         if offset <= len(rule) or prefix:
             yield prefix + rule[offset:], None, None
 
+    def _segmentize(self, parts):
+        """ Split a list of (literal, mask) tuples into path segments. Each
+            segment is returned as a (key, is_literal) tuple, where key is
+            either the literal text or a regular expression that matches the
+            entire segment. Return None if a mask may match a slash. """
+        segments, pieces = [], []
+        for text, mask, _ in parts:
+            if mask is None:
+                head, *tail = text.split('/')
+                if head:
+                    pieces.append((head, None))
+                for part in tail:
+                    segments.append(pieces)
+                    pieces = [(part, None)] if part else []
+            elif _re_segment_safe(mask):
+                pieces.append((None, mask))
+            else:
+                return None
+        segments.append(pieces)
+
+        result = []
+        for pieces in segments:
+            masks = [mask for (text, mask) in pieces if mask is not None]
+            if not masks:
+                result.append((''.join(text for (text, _) in pieces), True))
+            elif len(pieces) == 1:
+                result.append((masks[0], False))
+            else:
+                result.append((''.join(re.escape(text) if mask is None else
+                                       '(?:%s)' % mask
+                                       for (text, mask) in pieces), False))
+        return result
+
+    @staticmethod
+    def _segment_slots(parts):
+        """ Return a list of (key, segment index) tuples for all wildcards
+            of a rule, or None if a wildcard does not span an entire path
+            segment. """
+        slots, index, before = [], 0, None
+        for i, (text, mask, key) in enumerate(parts):
+            if mask is None:
+                index += text.count('/')
+                before = text
+                continue
+            after = parts[i + 1][0] if i + 1 < len(parts) else '/'
+            if not (before or '').endswith('/') or not (after or '').startswith('/'):
+                return None
+            slots.append((key, index))
+            before = None
+        return slots
+
+    @staticmethod
+    def _make_getargs(prelude, value, slots, **env):
+        """ Turn a list of (key, index, in_filter) tuples into a specialized
+            function that returns the URL arguments for a matching path.
+            `prelude` is a statement that prepares the values (e.g. by
+            matching the path) and `value` is an expression template to
+            access a single value by index. Anonymous wildcards (with a key
+            of None) are converted, but not returned. Return None if there is
+            nothing to do. """
+        items, checks, converters = [], [], 0
+        for key, index, in_filter in slots:
+            expr = value % index
+            if in_filter:
+                env['f%d' % converters] = in_filter
+                expr = 'f%d(%s)' % (converters, expr)
+                converters += 1
+            if key:
+                items.append('%r: %s' % (key, expr))
+            elif in_filter:
+                checks.append(expr)
+        if not items and not checks:
+            return None
+        body = checks + ['return {%s}' % ', '.join(items)]
+        if converters:
+            env['HTTPError'] = HTTPError
+            body = ['try:'] + ['    ' + line for line in body] + \
+                   ['except ValueError:',
+                    "    raise HTTPError(400, 'Path has wrong format.')"]
+        code = 'def getargs(path):\n    %s\n    %s' % (prelude, '\n    '.join(body))
+        exec(code, env)
+        return env['getargs']
+
     def add(self, rule, method, target, name=None):
         """ Add a new rule or replace the target for an existing rule. """
         anons = []  # Generated names of anonymous wildcards
         keys = []  # Names of keys
         pattern = ''  # Regular expression pattern with named groups
-        filters = []  # Lists of wildcard input filters
+        filters = {}  # Wildcard input filters by key
         builder = []  # Data structure for the URL builder
+        parts = []  # List of (literal, mask, key) tuples for the trie
         is_static = True
 
         for key, mode, conf in self._itertokens(rule):
@@ -345,18 +724,24 @@ class Router:
                     anons.append(key)
                 pattern += '(?P<%s>%s)' % (key, mask)
                 keys.append(key)
-                if in_filter: filters.append((key, in_filter))
+                filters[key] = in_filter
                 builder.append((key, out_filter or str))
+                parts.append((None, _re_flatten(mask), key))
             elif key:
                 pattern += re.escape(key)
                 builder.append((None, key))
+                parts.append((key, None, None))
 
         self.builder[rule] = builder
-        if name: self.builder[name] = builder
+        self._builders[rule] = self._make_builder(builder) if builder else None
+        if name:
+            self.builder[name] = builder
+            self._builders[name] = self._builders[rule]
 
         if is_static and not self.strict_order:
             self.static.setdefault(method, {})
             self.static[method][self.build(rule)] = (target, None)
+            self._frozen = False
             return
 
         try:
@@ -365,30 +750,27 @@ class Router:
         except re.error as e:
             raise RouteSyntaxError("Could not add Route: %s (%s)" % (rule, e))
 
-        if filters:
-
-            def getargs(path):
-                url_args = re_match(path).groupdict()
-                for name, wildcard_filter in filters:
-                    try:
-                        url_args[name] = wildcard_filter(url_args[name])
-                    except ValueError:
-                        raise HTTPError(400, 'Path has wrong format.')
-                for key in anons:
-                    del url_args[key]
-                return url_args
-        elif re_pattern.groupindex:
-
-            def getargs(path):
-                url_args = re_match(path).groupdict()
-                for key in anons:
-                    del url_args[key]
-                return url_args
-        else:
-            getargs = None
+        # Wildcard values are fetched by group index. Anonymous wildcards
+        # are converted (and may fail), but not returned.
+        slots = [(None if key in anons else key, re_pattern.groupindex[key],
+                  filters[key]) for key in keys]
+        getargs = self._make_getargs('g = re_match(path).group', 'g(%d)',
+                                     slots, re_match=re_match)
 
         flatpat = _re_flatten(pattern)
         whole_rule = (rule, flatpat, target, getargs)
+        self._segments[flatpat] = self._segmentize(parts)
+
+        # In trie mode, rules with one wildcard per segment can skip the
+        # regular expression entirely and split the path instead.
+        segment_slots = self._segments[flatpat] and self._segment_slots(parts)
+        if segment_slots is not None:
+            slots = [(None if key in anons else key, index, filters[key])
+                     for (key, index) in segment_slots]
+            self._segment_getargs[rule] = self._make_getargs(
+                "s = path.split('/')", 's[%d]', slots)
+        else:
+            self._segment_getargs.pop(rule, None)
 
         if (flatpat, method) in self._groups:
             if DEBUG:
@@ -400,11 +782,40 @@ class Router:
             self.dyna_routes.setdefault(method, []).append(whole_rule)
             self._groups[flatpat, method] = len(self.dyna_routes[method]) - 1
 
-        self._compile(method)
+        self._frozen = False
+
+    def freeze(self):
+        """ Compile the search structures for all dynamic routes at once.
+
+            This happens automatically on the first call to :meth:`match` after
+            routes were added, but can be triggered explicitly (e.g. during
+            application startup) to keep that work out of the first request.
+            The compiled structures are never changed afterwards. Adding a route
+            or changing the :attr:`mode` discards them, and they are rebuilt
+            with the next call to :meth:`match` or :meth:`freeze`. """
+        regexes, tries = {}, {}
+        for method in self.dyna_routes:
+            if self._mode == 'trie':
+                tries[method] = self._compile_trie(method)
+            else:
+                regexes[method] = self._compile(method)
+        if self._stats is not None:
+            for method, chunks in regexes.items():
+                regexes[method] = [(self._count_chunk(combined), rules)
+                                   for (combined, rules) in chunks]
+            for trie in tries.values():
+                trie.fallback = [(self._count_chunk(combined), rules)
+                                 for (combined, rules) in trie.fallback]
+        self.dyna_regexes, self.dyna_tries = regexes, tries
+        self._allow_index = self._compile_allow_index()
+        if self._cache:
+            self._cache.clear()
+        self._frozen = True
+        return self
 
     def _compile(self, method):
         all_rules = self.dyna_routes[method]
-        comborules = self.dyna_regexes[method] = []
+        comborules = []
         maxgroups = self._MAX_GROUPS_PER_PATTERN
         for x in range(0, len(all_rules), maxgroups):
             some = all_rules[x:x + maxgroups]
@@ -413,31 +824,178 @@ class Router:
             combined = re.compile(combined).match
             rules = [(target, getargs) for (_, _, target, getargs) in some]
             comborules.append((combined, rules))
+        return comborules
+
+    def _compile_allow_index(self):
+        """ Build an index to find all methods that accept a given path. Static
+            paths are looked up in a dict. Dynamic rules are merged (same
+            pattern, different methods) and stored in a single trie, so finding
+            alternative methods for a 405 response is a single lookup instead
+            of a search for each method. """
+        static = {}
+        for method, routes in self.static.items():
+            for path in routes:
+                static.setdefault(path, set()).add(method)
+        static = {path: frozenset(methods) for path, methods in static.items()}
+
+        patterns = {}
+        for method, rules in self.dyna_routes.items():
+            for (_, flatpat, _, _) in rules:
+                patterns.setdefault(flatpat, set()).add(method)
+
+        trie, fallback = _RouteTrie(self._MAX_GROUPS_PER_PATTERN), []
+        for index, (flatpat, methods) in enumerate(patterns.items()):
+            segments = self._segments[flatpat]
+            if segments is None:
+                match = re.compile('^%s$' % flatpat).match
+                fallback.append((match, frozenset(methods)))
+            else:
+                trie.add(index, segments, frozenset(methods), None)
+        return static, trie, fallback
+
+    def _allowed_methods(self, path):
+        """ Return the set of all methods that accept a given path. """
+        static, trie, fallback = self._allow_index
+        allowed = set(static.get(path, ()))
+        for methods in trie.match_all(path):
+            allowed.update(methods)
+        for match, methods in fallback:
+            if not methods <= allowed and match(path):
+                allowed.update(methods)
+        return allowed
+
+    def _compile_trie(self, method):
+        trie = _RouteTrie(self._MAX_GROUPS_PER_PATTERN)
+        fallback = []
+        for index, (rule, flatpat, target, getargs) in enumerate(self.dyna_routes[method]):
+            segments = self._segments[flatpat]
+            if segments is None:
+                fallback.append((index, flatpat, target, getargs))
+            else:
+                getargs = self._segment_getargs.get(rule, getargs)
+                trie.add(index, segments, target, getargs)
+        trie.add_fallback(fallback)
+        return trie
+
+    @staticmethod
+    def _make_builder(builder):
+        """ Turn a builder structure into a specialized function that pops all
+            wildcard values from a dict and returns the path part of the URL. """
+        template, args, env = '', [], {}
+        for key, value in builder:
+            if not key:
+                template += value.replace('%', '%%')
+            elif value is str:  # The %s placeholder does the same
+                template += '%s'
+                args.append('query.pop(%r)' % key)
+            else:
+                template += '%s'
+                env['f%d' % len(args)] = value
+                args.append('f%d(query.pop(%r))' % (len(args), key))
+        if not args:
+            url = ''.join(value for (key, value) in builder)
+            return lambda query: url
+        env['template'] = template
+        exec('def build(query):\n    return template %% (%s,)' % ', '.join(args), env)
+        return env['build']
 
     def build(self, _name, *anons, **query):
         """ Build an URL by filling the wildcards in a rule. """
-        builder = self.builder.get(_name)
+        builder = self._builders.get(_name)
         if not builder:
             raise RouteBuildError("No route with that name.", _name)
         try:
             for i, value in enumerate(anons):
                 query['anon%d' % i] = value
-            url = ''.join([f(query.pop(n)) if n else f for (n, f) in builder])
+            url = builder(query)
             return url if not query else url + '?' + urlencode(query, doseq=True)
         except KeyError as E:
             raise RouteBuildError('Missing URL argument: %r' % E.args[0])
 
+    def build_many(self, _name, params):
+        """ Build a list of URLs for the same named route. Each item in
+            `params` is either a dict of keyword arguments or a tuple of
+            anonymous wildcard values (see :meth:`build`). This is faster
+            than calling :meth:`build` in a loop, e.g. for pagination. """
+        builder = self._builders.get(_name)
+        if not builder:
+            raise RouteBuildError("No route with that name.", _name)
+        urls = []
+        try:
+            for query in params:
+                if isinstance(query, dict):
+                    query = query.copy()
+                else:
+                    query = {'anon%d' % i: v for i, v in enumerate(query)}
+                url = builder(query)
+                urls.append(url + '?' + urlencode(query, doseq=True) if query else url)
+        except KeyError as E:
+            raise RouteBuildError('Missing URL argument: %r' % E.args[0])
+        return urls
+
     def match(self, environ):
         """ Return a (target, url_args) tuple or raise HTTPError(400/404/405). """
+        if not self._frozen:
+            self.freeze()
         verb = environ['REQUEST_METHOD'].upper()
         path = environ['PATH_INFO'] or '/'
+        if self._stats is not None:
+            return self._profile_match(verb, path)
+        if self._cache is None:
+            return self._match(verb, path)
+        return self._cached_match(verb, path)
+
+    def _profile_match(self, verb, path):
+        stats = self._stats
+        start = time.perf_counter()
+        try:
+            if self._cache is None:
+                target, url_args = self._match(verb, path)
+            else:
+                target, url_args = self._cached_match(verb, path)
+        except HTTPError as E:
+            errors = stats['errors']
+            errors[E.status_code] = errors.get(E.status_code, 0) + 1
+            raise
+        else:
+            hits = stats['hits']
+            hits[target] = hits.get(target, 0) + 1
+            return target, url_args
+        finally:
+            stats['matches'] += 1
+            stats['time'] += time.perf_counter() - start
+
+    def _cached_match(self, verb, path):
+        key, cache = (verb, path), self._cache
+        try:
+            target, url_args = cache[key]
+            cache.move_to_end(key)
+            self.cache_hits += 1
+            return target, dict(url_args)
+        except KeyError:
+            self.cache_misses += 1
+        target, url_args = self._match(verb, path)
+        if all(isinstance(v, _IMMUTABLE_TYPES) for v in url_args.values()):
+            cache[key] = (target, dict(url_args))
+            while len(cache) > self._cache_size:
+                try:
+                    cache.popitem(last=False)
+                except KeyError:  # Emptied by a different thread
+                    break
+        return target, url_args
 
+    def _match(self, verb, path):
         methods = ('PROXY', 'HEAD', 'GET', 'ANY') if verb == 'HEAD' else ('PROXY', verb, 'ANY')
 
         for method in methods:
             if method in self.static and path in self.static[method]:
                 target, getargs = self.static[method][path]
                 return target, getargs(path) if getargs else {}
+            elif method in self.dyna_tries:
+                found = self.dyna_tries[method].match(path)
+                if found:
+                    _, target, getargs = found
+                    return target, getargs(path) if getargs else {}
             elif method in self.dyna_regexes:
                 for combined, rules in self.dyna_regexes[method]:
                     match = combined(path)
@@ -446,16 +1004,7 @@ class Router:
                         return target, getargs(path) if getargs else {}
 
         # No matching route found. Collect alternative methods for 405 response
-        allowed = set([])
-        nocheck = set(methods)
-        for method in set(self.static) - nocheck:
-            if path in self.static[method]:
-                allowed.add(method)
-        for method in set(self.dyna_regexes) - allowed - nocheck:
-            for combined, rules in self.dyna_regexes[method]:
-                match = combined(path)
-                if match:
-                    allowed.add(method)
+        allowed = self._allowed_methods(path).difference(methods)
         if allowed:
             allow_header = ",".join(sorted(allowed))
             raise HTTPError(405, "Method not allowed.", Allow=allow_header)
@@ -473,7 +1022,8 @@ class Route:
     def __init__(self, app, rule, method, callback,
                  name=None,
                  plugins=None,
-                 skiplist=None, **config):
+                 skiplist=None,
+                 host=None, **config):
         #: The application this route is installed to.
         self.app = app
         #: The path-rule string (e.g. ``/wiki/<page>``).
@@ -488,6 +1038,9 @@ class Route:
         self.plugins = plugins or []
         #: A list of plugins to not apply to this route (see :meth:`Bottle.route`).
         self.skiplist = skiplist or []
+        #: The host name pattern this route is restricted to (see
+        #: :meth:`Bottle.route`) or ``None``.
+        self.host = host or None
         #: Additional keyword arguments passed to the :meth:`Bottle.route`
         #: decorator are stored in this dictionary. Used for route-specific
         #: plugin configuration and meta-data.
@@ -623,8 +1176,23 @@ class Bottle:
 
         self.routes = []  # List of installed :class:`Route` instances.
         self.router = Router()  # Maps requests to :class:`Route` instances.
+        self.host_routers = {}  # Maps host name patterns to :class:`Router` instances.
         self.error_handler = {}
 
+        self.config._add_change_listener(self._on_router_config)
+        self.config._define('router.mode', default='regex',
+                            help="Search strategy for dynamic routes"
+                                 " ('regex' or 'trie').")
+        self.config._define('router.cache', default=0,
+                            help="Number of (method, path) lookups to cache."
+                                 " Zero disables the cache.")
+        self.config._define('router.profile', default=False, validate=bool,
+                            help="Collect routing statistics (see Router.stats).")
+
+        # Pre-encoded (name, value) tuples from 'response.headers.*' keys.
+        self._static_headers = []
+        self.config._add_change_listener(self._on_response_config)
+
         # Core plugins
         self.plugins = []  # List of installed plugins.
         self.install(JSONPlugin())
@@ -676,6 +1244,62 @@ class Bottle:
 
         return decorator
 
+    def _on_router_config(self, config, key, value):
+        routers = [self.router] + list(self.host_routers.values())
+        if key == 'router.mode':
+            for router in routers:
+                router.mode = value
+        elif key == 'router.cache':
+            for router in routers:
+                router.cache_size = value
+        elif key == 'router.profile':
+            for router in routers:
+                router.profile = value
+
+    def _on_response_config(self, config, key, value):
+        if not key.startswith('response.headers.'):
+            return
+        name = _hkey(key[17:])
+        headers = [h for h in self._static_headers if h[0] != name]
+        if value is not None:
+            value = _wsgi_encode(_hval(value))
+            headers.append((name, value))
+        headers.sort(key=lambda header: header[0] == 'Content-Type')
+        self._static_headers[:] = headers
+
+    def _get_host_router(self, host):
+        """ Return the :class:`Router` for a host name pattern. Create it on
+            first use. """
+        host = host.lower().rstrip('.')
+        if '*' in host.lstrip('*') or (host.startswith('*') and not host.startswith('*.')):
+            raise ValueError('Invalid host pattern: %r' % host)
+        if host not in self.host_routers:
+            self.host_routers[host] = Router(mode=self.config['router.mode'],
+                                             cache_size=self.config['router.cache'],
+                                             profile=self.config['router.profile'])
+        return self.host_routers[host]
+
+    def _find_routers(self, environ):
+        """ Return the routers to search for the requested host name, in
+            order: The router for the exact name, routers for wildcard
+            patterns (more specific first) and the router shared by all
+            hosts. """
+        host = (environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')).lower()
+        if not host.endswith(']'):  # Strip port, but not from IPv6 addresses
+            host = host.rpartition(':')[0] or host
+        host = name = host.rstrip('.')
+        routers = []
+        while True:
+            router = self.host_routers.get(name)
+            if router is not None:
+                routers.append(router)
+            if '.' not in host:
+                break
+            host = host.partition('.')[2]
+            name = '*.' + host
+        routers.append(self.router)
+        return routers
+
     def _mount_wsgi(self, prefix, app, **options):
         segments = [p for p in prefix.split('/') if p]
         if not segments:
@@ -829,19 +1453,51 @@ class Bottle:
         """ Search for a matching route and return a (:class:`Route`, urlargs)
             tuple. The second value is a dictionary with parameters extracted
             from the URL. Raise :exc:`HTTPError` (404/405) on a non-match."""
-        return self.router.match(environ)
+        if not self.host_routers:
+            return self.router.match(environ)
+        allowed, error = set(), None
+        for router in self._find_routers(environ):
+            try:
+                return router.match(environ)
+            except HTTPError as E:
+                if E.status_code == 405:
+                    allowed.update(E.get_header('Allow').split(','))
+                elif E.status_code != 404:
+                    raise
+                error = error or E
+        if allowed:
+            raise HTTPError(405, "Method not allowed.", Allow=",".join(sorted(allowed)))
+        raise error
+
+    def _build_router(self, routename):
+        """ Return the router to build URLs for a named route. Routes bound to
+            the host of the current request are preferred. """
+        if self.host_routers:
+            for router in self._find_routers(request.environ):
+                if routename in router.builder:
+                    return router
+        return self.router
 
     def get_url(self, routename, **kargs):
         """ Return a string that matches a named route """
         scriptname = request.environ.get('SCRIPT_NAME', '').strip('/') + '/'
-        location = self.router.build(routename, **kargs).lstrip('/')
+        location = self._build_router(routename).build(routename, **kargs).lstrip('/')
         return urljoin(urljoin('/', scriptname), location)
 
+    def get_urls(self, routename, params):
+        """ Return a list of strings that match a named route, one for each
+            dict of keyword arguments in `params`. See :meth:`Router.build_many`. """
+        scriptname = request.environ.get('SCRIPT_NAME', '').strip('/') + '/'
+        base = urljoin('/', scriptname)
+        return [urljoin(base, location.lstrip('/'))
+                for location in self._build_router(routename).build_many(routename, params)]
+
     def add_route(self, route):
         """ Add a route object, but do not change the :data:`Route.app`
             attribute."""
         self.routes.append(route)
-        self.router.add(route.rule, route.method, route, name=route.name)
+        router = self._get_host_router(route.host) if route.host else self.router
+        router.add(route.rule, route.method, route, name=route.name)
         if DEBUG: route.prepare()
 
     def route(self,
@@ -850,7 +1506,8 @@ class Bottle:
               callback=None,
               name=None,
               apply=None,
-              skip=None, **config):
+              skip=None,
+              host=None, **config):
         """ A decorator to bind a function to a request URL. Example::
 
                 @app.route('/hello/<name>')
@@ -872,6 +1529,10 @@ class Bottle:
               applied to the route callback in addition to installed plugins.
             :param skip: A list of plugins, plugin classes or names. Matching
               plugins are not installed to this route. ``True`` skips all.
+            :param host: A host name (e.g. ``example.com``) or wildcard pattern
+              (e.g. ``*.example.com``). The route only matches requests for
+              that host. Routes without a host match all hosts, but are only
+              considered if no host specific route matches the path.
 
             Any additional keyword arguments are stored as route-specific
             configuration and passed to plugins (see :meth:`Plugin.apply`).
@@ -889,7 +1550,8 @@ class Bottle:
                     route = Route(self, rule, verb, callback,
                                   name=name,
                                   plugins=plugins,
-                                  skiplist=skiplist, **config)
+                                  skiplist=skiplist,
+                                  host=host, **config)
                     self.add_route(route)
             return callback
 
@@ -938,46 +1600,68 @@ class Bottle:
         return decorator(callback) if callback else decorator
 
     def default_error_handler(self, res):
+        # The error page is HTML, regardless of static Content-Type headers.
+        if 'Content-Type' not in response and 'Content-Type' not in res:
+            response['Content-Type'] = 'text/html; charset=UTF-8'
         return tob(template(ERROR_PAGE_TEMPLATE, e=res, template_settings=dict(name='__ERROR_PAGE_TEMPLATE')))
 
-    def _handle(self, environ):
+    def _handle_prepare(self, environ):
+        """ Bind the request and response context locals for a new request.
+            Shared by :meth:`_handle` and :meth:`_handle_async`. """
         path = environ['bottle.raw_path'] = environ['PATH_INFO']
         environ['PATH_INFO'] = _wsgi_recode(path)
 
         environ['bottle.app'] = self
         request.bind(environ)
         response.bind()
+
+    def _handle_match(self, environ):
+        """ Find the route for the current request and store it in environ. """
+        route, args = self.match(environ)
+        environ['route.handle'] = route
+        environ['bottle.route'] = route
+        environ['route.url_args'] = args
+        return route, args
+
+    def _handle_error(self, environ, out, error):
+        """ Turn an unhandled exception into a 500 response (or re-raise it if
+            :attr:`catchall` is disabled). """
+        _try_close(out)
+        if not self.catchall: raise error
+        stacktrace = format_exc()
+        environ['wsgi.errors'].write(stacktrace)
+        environ['wsgi.errors'].flush()
+        environ['bottle.exc_info'] = sys.exc_info()
+        out = HTTPError(500, "Internal Server Error", error, stacktrace)
+        out.apply(response)
+        return out
+
+    def _handle(self, environ):
+        self._handle_prepare(environ)
         out = None
+        hooks = self._hooks  # Skip hooks entirely if none are installed
 
         try:
             try:
-                self.trigger_hook('before_request')
-                route, args = self.router.match(environ)
-                environ['route.handle'] = route
-                environ['bottle.route'] = route
-                environ['route.url_args'] = args
+                if hooks['before_request']:
+                    self.trigger_hook('before_request')
+                route, args = self._handle_match(environ)
                 out = route.call(**args)
             except HTTPResponse as E:
                 out = E
             finally:
                 if isinstance(out, HTTPResponse):
                     out.apply(response)
-                try:
-                    self.trigger_hook('after_request')
-                except HTTPResponse as E:
-                    out = E
-                    out.apply(response)
+                if hooks['after_request']:
+                    try:
+                        self.trigger_hook('after_request')
+                    except HTTPResponse as E:
+                        out = E
+                        out.apply(response)
         except (KeyboardInterrupt, SystemExit, MemoryError):
             raise
         except Exception as E:
-            _try_close(out)
-            if not self.catchall: raise
-            stacktrace = format_exc()
-            environ['wsgi.errors'].write(stacktrace)
-            environ['wsgi.errors'].flush()
-            environ['bottle.exc_info'] = sys.exc_info()
-            out = HTTPError(500, "Internal Server Error", E, stacktrace)
-            out.apply(response)
+            out = self._handle_error(environ, out, E)
 
         return out
 
@@ -1015,13 +1699,25 @@ class Bottle:
             out.apply(response)
             return self._cast(out.body)
 
-        # File-like objects.
+        # File-like objects. Server-provided wrappers only know how to send a
+        # file from its current position to the end, so ranges are kept.
+        if isinstance(out, WSGIFileWrapper):
+            if out.offset is not None or out.length is not None:
+                return out
         if hasattr(out, 'read'):
             if 'wsgi.file_wrapper' in request.environ:
                 return request.environ['wsgi.file_wrapper'](out)
             elif hasattr(out, 'close') or not hasattr(out, '__iter__'):
                 return WSGIFileWrapper(out)
 
+        # Coroutines and async iterators need an event loop.
+        if inspect.iscoroutine(out) or hasattr(out, '__aiter__'):
+            if inspect.iscoroutine(out):
+                out.close()  # Prevent a 'coroutine was never awaited' warning
+            msg = 'Async route callbacks require Bottle.asgi (got %s).' % type(out)
+            if not self.catchall: raise TypeError(msg)
+            return self._cast(HTTPError(500, msg))
+
         # Handle Iterables. We peek into them to detect their inner type.
         try:
             iout = iter(out)
@@ -1069,7 +1765,8 @@ class Bottle:
             exc_info = environ.get('bottle.exc_info')
             if exc_info is not None:
                 del environ['bottle.exc_info']
-            start_response(response._wsgi_status_line(), response.headerlist, exc_info)
+            start_response(response._wsgi_status_line(),
+                           response._headerlist(self._static_headers), exc_info)
             return out
         except (KeyboardInterrupt, SystemExit, MemoryError):
             raise
@@ -1088,6 +1785,204 @@ class Bottle:
             start_response('500 INTERNAL SERVER ERROR', headers, sys.exc_info())
             return [tob(err)]
 
+    async def asgi(self, scope, receive, send):
+        """ The bottle ASGI-interface. Pass this method (not the application
+            itself) to an ASGI server to run the application on an asyncio
+            event loop.
+
+            Route callbacks and ``before_request``/``after_request`` hooks
+            may be coroutine functions and are awaited. Callbacks may also
+            return an asynchronous iterator to stream the response body.
+            Synchronous callbacks are called in a thread pool (the default
+            executor of the event loop), so they do not block other
+            requests. The request body is read completely before the
+            callback is called. """
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: %r' % scope['type'])
+
+        body, size = BytesIO(), 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > BaseRequest.MEMFILE_MAX and isinstance(body, BytesIO):
+                spool = tempfile.TemporaryFile(mode='w+b')
+                spool.write(body.getvalue())
+                body = spool
+            body.write(chunk)
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        environ = self._asgi_environ(scope, body, size)
+        out = await self._handle_async(environ)
+        # Look into HTTPResponse objects, their body may be an iterator, too.
+        # HTTPError objects call a (synchronous) error handler on cast.
+        inner = out
+        if isinstance(out, HTTPResponse) and not isinstance(out, HTTPError):
+            inner = out.body
+        if hasattr(inner, '__aiter__'):
+            if inner is not out:
+                out.apply(response)
+            out = self._aiter_encode(inner)
+        elif isinstance(inner, (bytes, bytearray, str, list, tuple)) or not inner:
+            out = self._cast(out)
+        else:  # Peeking into iterators or calling error handlers may block
+            out = await self._run_sync(self._cast, out)
+        environ.pop('bottle.exc_info', None)
+
+        headers = [(name.lower().encode('latin1'), value.encode('latin1'))
+                   for name, value in response._headerlist(self._static_headers)]
+        await send({'type': 'http.response.start',
+                    'status': response._status_code,
+                    'headers': headers})
+        try:
+            if response._status_code in (100, 101, 204, 304) \
+               or environ['REQUEST_METHOD'] == 'HEAD':
+                pass
+            elif hasattr(out, '__aiter__'):
+                async for chunk in out:
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+            elif isinstance(out, (list, tuple)):
+                for chunk in out:
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+            else:
+                chunks = iter(out)
+                while True:
+                    chunk = await self._run_sync(next, chunks, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body',
+                                'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(out, 'aclose'):
+                await out.aclose()
+            _try_close(out)
+            body.close()
+
+    @staticmethod
+    def _asgi_environ(scope, body, size):
+        """ Turn an ASGI http scope into a WSGI environ dictionary. """
+        server = scope.get('server') or ('localhost', None)
+        root = scope.get('root_path', '')
+        path = scope['path']
+        if root and path.startswith(root):
+            path = path[len(root):]
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root.encode('utf8').decode('latin1'),
+            'PATH_INFO': path.encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'asgi.scope': scope,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+        for name, value in scope.get('headers', ()):
+            key = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if key == 'CONTENT_LENGTH' or key == 'TRANSFER_ENCODING':
+                continue  # The body is already complete and decoded
+            if key != 'CONTENT_TYPE':
+                key = 'HTTP_' + key
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ', ') + value
+            environ[key] = value
+        return environ
+
+    @staticmethod
+    async def _run_sync(func, *args, **kwargs):
+        """ Call a function in the default executor of the running event loop
+            with a copy of the current context. """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(None, call)
+
+    async def _call_async(self, func, *args, **kwargs):
+        """ Await coroutine functions, run all other functions in a thread. """
+        if inspect.iscoroutinefunction(func):
+            out = await func(*args, **kwargs)
+        else:
+            out = await self._run_sync(func, *args, **kwargs)
+        if inspect.isawaitable(out):  # e.g. a sync decorator on a coroutine
+            out = await out
+        return out
+
+    async def _trigger_hook_async(self, name):
+        """ Trigger a hook. Coroutine functions are awaited, all other hooks
+            are called in a thread (see :meth:`_call_async`). """
+        for hook in self._hooks[name][:]:
+            await self._call_async(hook)
+
+    @staticmethod
+    async def _aiter_encode(out):
+        try:
+            async for chunk in out:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(response.charset)
+                if chunk:
+                    yield chunk
+        finally:
+            if hasattr(out, 'aclose'):
+                await out.aclose()
+
+    async def _handle_async(self, environ):
+        """ Same as :meth:`_handle`, but await asynchronous hooks and route
+            callbacks and run synchronous ones in a thread pool. """
+        self._handle_prepare(environ)
+        out = None
+        hooks = self._hooks
+
+        try:
+            try:
+                if hooks['before_request']:
+                    await self._trigger_hook_async('before_request')
+                route, args = self._handle_match(environ)
+                out = await self._call_async(route.call, **args)
+            except HTTPResponse as E:
+                out = E
+            finally:
+                if isinstance(out, HTTPResponse):
+                    out.apply(response)
+                if hooks['after_request']:
+                    try:
+                        await self._trigger_hook_async('after_request')
+                    except HTTPResponse as E:
+                        out = E
+                        out.apply(response)
+        except (KeyboardInterrupt, SystemExit, MemoryError):
+            raise
+        except Exception as E:
+            out = self._handle_error(environ, out, E)
+
+        return out
+
     def __call__(self, environ, start_response):
         """ Each instance of :class:'Bottle' is a WSGI application. """
         return self.wsgi(environ, start_response)
@@ -1124,6 +2019,15 @@ class BaseRequest:
     #: Maximum size of memory buffer for :attr:`body` in bytes.
     MEMFILE_MAX = 102400
 
+    #: Maximum size of a JSON request body (:attr:`json`) or a single
+    #: record (:meth:`iter_json`) in bytes. Defaults to :attr:`MEMFILE_MAX`.
+    JSON_MAX = None
+
+    #: Function used to parse JSON request bodies. It is called with a
+    #: :class:`bytes` object and should raise :exc:`ValueError` on errors.
+    #: Set this to e.g. ``orjson.loads`` to use a faster JSON library.
+    json_decoder = staticmethod(json_lds)
+
     def __init__(self, environ=None):
         """ Wrap a WSGI environ dictionary. """
         #: The wrapped WSGI environ dictionary. This is the only real attribute.
@@ -1199,10 +2103,8 @@ class BaseRequest:
             values are sometimes called "URL arguments" or "GET parameters", but
             not to be confused with "URL wildcards" as they are provided by the
             :class:`Router`. """
-        get = self.environ['bottle.get'] = FormsDict()
-        pairs = _parse_qsl(self.environ.get('QUERY_STRING', ''), 'utf8')
-        for key, value in pairs:
-            get[key] = value
+        get = _LazyFormsDict(self.environ.get('QUERY_STRING', ''), 'utf8')
+        self.environ['bottle.get'] = get
         return get
 
     @DictProperty('environ', 'bottle.request.forms', read_only=True)
@@ -1244,22 +2146,62 @@ class BaseRequest:
     def json(self):
         """ If the ``Content-Type`` header is ``application/json`` or
             ``application/json-rpc``, this property holds the parsed content
-            of the request body. Only requests smaller than :attr:`MEMFILE_MAX`
-            are processed to avoid memory exhaustion.
-            Invalid JSON raises a 400 error response.
+            of the request body. Only requests smaller than :attr:`JSON_MAX`
+            are processed to avoid memory exhaustion, larger requests raise
+            a 413 error response. Invalid JSON raises a 400 error response.
+            The body is parsed with :attr:`json_decoder`.
         """
         ctype = self.environ.get('CONTENT_TYPE', '').lower().split(';')[0]
         if ctype in ('application/json', 'application/json-rpc'):
-            b = self._get_body_string(self.MEMFILE_MAX)
+            b = self._get_body_string(self.JSON_MAX or self.MEMFILE_MAX)
             if not b:
                 return None
-            try:
-                return json_loads(b)
-            except (ValueError, TypeError) as err:
-                raise HTTPError(400, 'Invalid JSON', exception=err)
+            return self._parse_json(b)
         return None
 
-    def _iter_body(self, read, bufsize):
+    def _parse_json(self, data):
+        try:
+            return self.json_decoder(data)
+        except (ValueError, TypeError) as err:
+            raise HTTPError(400, 'Invalid JSON', exception=err)
+
+    def iter_json(self, maxsize=None):
+        """ Parse the request body as a stream of newline-delimited JSON
+            records (also known as NDJSON or JSON Lines) and yield each record
+            as soon as its line is complete. Blank lines are skipped. The
+            content type is not checked.
+
+            The body is read with :meth:`stream` and not buffered, so only
+            a single record needs to fit into memory. Records larger than
+            :attr:`JSON_MAX` raise a 413 error response, invalid records a
+            400 error response.
+
+            :param maxsize: Maximum size of the entire body (see :meth:`stream`).
+        """
+        maxline = self.JSON_MAX or self.MEMFILE_MAX
+        parse, buf = self._parse_json, bytearray()
+        for part in self.stream(maxsize=maxsize):
+            # Only search the new part for line breaks. The incomplete line
+            # at the start of the buffer was already scanned.
+            start, scan = 0, len(buf)
+            buf += part
+            while True:
+                end = buf.find(b'\n', scan)
+                if end < 0: break
+                if end - start > maxline:
+                    raise HTTPError(413, 'Request entity too large')
+                line = bytes(buf[start:end])
+                if line.strip():
+                    yield parse(line)
+                start = scan = end + 1
+            del buf[:start]
+            if len(buf) > maxline:
+                raise HTTPError(413, 'Request entity too large')
+        if buf.strip():
+            yield parse(bytes(buf))
+
+    def _iter_body(self, fp, bufsize):
+        read = fp.read
         maxread = max(0, self.content_length)
         while maxread:
             part = read(min(maxread, bufsize))
@@ -1268,43 +2210,57 @@ class BaseRequest:
             maxread -= len(part)
 
     @staticmethod
-    def _iter_chunked(read, bufsize):
+    def _iter_chunked(fp, bufsize):
+        """ Decode a chunked transfer body. Size lines and trailers are read
+            with `readline`, chunk data with as few `read` calls as possible
+            and without copying. The CRLF after each chunk is read together
+            with the (last part of the) chunk data and cut off with a
+            memoryview, so small chunks need a single `read` call. """
         err = HTTPError(400, 'Error while parsing chunked transfer body.')
-        rn, sem, bs = b'\r\n', b';', b''
+        read, readline, rn, sem = fp.read, fp.readline, b'\r\n', b';'
         while True:
-            header = read(1)
-            while header[-2:] != rn:
-                c = read(1)
-                header += c
-                if not c: raise err
-                if len(header) > bufsize: raise err
-            size, _, _ = header.partition(sem)
+            header = readline(bufsize)
+            if header[-2:] != rn: raise err
             try:
-                maxread = int(size.strip(), 16)
-            except ValueError:
-                raise err
-            if maxread == 0: break
-            buff = bs
-            while maxread > 0:
-                if not buff:
-                    buff = read(min(maxread, bufsize))
-                part, buff = buff[:maxread], buff[maxread:]
+                size = int(header, 16)
+            except ValueError:  # Chunk extensions
+                try:
+                    size = int(header.partition(sem)[0], 16)
+                except ValueError:
+                    raise err
+            if size < 0: raise err
+            if size == 0: break
+            maxread, tail = size + 2, b''
+            while maxread > 2:
+                part = read(min(maxread, bufsize))
                 if not part: raise err
-                yield part
                 maxread -= len(part)
-            if read(2) != rn:
-                raise err
+                if maxread < 2:
+                    tail = part[maxread - 2:]
+                    part = memoryview(part)[:maxread - 2]
+                if part: yield part
+            if maxread: tail += read(maxread)
+            if tail != rn: raise err
+        # Skip optional trailer fields. A missing final CRLF is tolerated.
+        maxread = bufsize
+        while True:
+            line = readline(maxread)
+            if line == rn or not line: break
+            maxread -= len(line)
+            if line[-2:] != rn or maxread <= 0: raise err
 
     @DictProperty('environ', 'bottle.request.body', read_only=True)
     def _body(self):
+        if 'bottle.request.stream' in self.environ:
+            raise RuntimeError('Request body was already consumed by stream().')
         try:
-            read_func = self.environ['wsgi.input'].read
+            fp = self.environ['wsgi.input']
         except KeyError:
             self.environ['wsgi.input'] = BytesIO()
             return self.environ['wsgi.input']
         body_iter = self._iter_chunked if self.chunked else self._iter_body
         body, body_size, is_temp_file = BytesIO(), 0, False
-        for part in body_iter(read_func, self.MEMFILE_MAX):
+        for part in body_iter(fp, self.MEMFILE_MAX):
             body.write(part)
             body_size += len(part)
             if not is_temp_file and body_size > self.MEMFILE_MAX:
@@ -1336,6 +2292,53 @@ class BaseRequest:
         self._body.seek(0)
         return self._body
 
+    def stream(self, bufsize=None, maxsize=None):
+        """ Return an iterator over the request body as a sequence of
+            bytes-like objects (:class:`bytes` or :class:`memoryview`) of up
+            to `bufsize` bytes each (default: :attr:`MEMFILE_MAX`).
+
+            Unlike :attr:`body`, the data is read directly from ``wsgi.input``
+            and not buffered in memory or in a temporary file, which makes
+            this the method of choice for large uploads that are passed on
+            to some other destination. Chunked transfer encoding is decoded
+            on the fly. The stream can only be consumed once. :attr:`body`
+            and all attributes that depend on it (e.g. :attr:`forms` or
+            :attr:`json`) are no longer available afterwards. If the body
+            was already buffered, the buffered copy is streamed instead.
+
+            :param maxsize: Raise :exc:`HTTPError` (413) if the body is larger
+                than this many bytes. The check is done up front for requests
+                with a `Content-Length` header, and while streaming for
+                chunked requests.
+        """
+        bufsize = bufsize or self.MEMFILE_MAX
+        if maxsize is not None and self.content_length > maxsize:
+            raise HTTPError(413, 'Request entity too large')
+        if 'bottle.request.body' in self.environ:
+            body = self.body
+            parts = iter(lambda: body.read(bufsize), b'')
+        elif 'bottle.request.stream' in self.environ:
+            raise RuntimeError('Request body was already consumed by stream().')
+        else:
+            self.environ['bottle.request.stream'] = True
+            try:
+                fp = self.environ['wsgi.input']
+            except KeyError:
+                return iter(())
+            body_iter = self._iter_chunked if self.chunked else self._iter_body
+            parts = body_iter(fp, bufsize)
+        if maxsize is None or not self.chunked:
+            return parts
+        return self._iter_limited(parts, maxsize)
+
+    @staticmethod
+    def _iter_limited(parts, maxsize):
+        for part in parts:
+            maxsize -= len(part)
+            if maxsize < 0:
+                raise HTTPError(413, 'Request entity too large')
+            yield part
+
     @property
     def chunked(self):
         """ True if Chunked transfer encoding was. """
@@ -1560,11 +2563,24 @@ class BaseRequest:
             raise AttributeError("Attribute not defined: %s" % name)
 
 
+#: Cache for :func:`_hkey` that maps already validated header names to their
+#: canonical (and interned) form. New entries are only added as long as the
+#: cache is smaller than `_HEADER_CACHE_MAX`.
+_hkey_cache = {}
+_HEADER_CACHE_MAX = 1024
+
+
 def _hkey(key):
-    key = touni(key)
-    if '\n' in key or '\r' in key or '\0' in key:
-        raise ValueError("Header names must not contain control characters: %r" % key)
-    return key.title().replace('_', '-')
+    name = _hkey_cache.get(key)
+    if name is not None:
+        return name
+    name = touni(key)
+    if '\n' in name or '\r' in name or '\0' in name:
+        raise ValueError("Header names must not contain control characters: %r" % name)
+    name = sys.intern(name.title().replace('_', '-'))
+    if type(key) is str and len(_hkey_cache) < _HEADER_CACHE_MAX:
+        _hkey_cache[key] = name
+    return name
 
 
 def _hval(value):
@@ -1574,6 +2590,16 @@ def _hval(value):
     return value
 
 
+for _name in ('Accept-Ranges', 'Age', 'Allow', 'Cache-Control', 'Connection',
+              'Content-Disposition', 'Content-Encoding', 'Content-Language',
+              'Content-Length', 'Content-Location', 'Content-Range',
+              'Content-Type', 'Date', 'ETag', 'Expires', 'Last-Modified',
+              'Link', 'Location', 'Pragma', 'Retry-After', 'Server',
+              'Set-Cookie', 'Transfer-Encoding', 'Vary', 'WWW-Authenticate'):
+    _hkey(_name), _hkey(_name.lower())
+del _name
+
+
 class HeaderProperty:
     def __init__(self, name, reader=None, writer=None, default=''):
         self.name, self.default = name, default
@@ -1603,6 +2629,10 @@ class BaseResponse:
     default_status = 200
     default_content_type = 'text/html; charset=UTF-8'
 
+    # Pre-encoded headers of a frozen response (see HTTPResponse.freeze),
+    # mapping header names to lists of (name, value) tuples.
+    _frozen_headers = ()
+
     # Header denylist for specific response codes
     # (rfc2616 section 10.2.3 and 10.3.5)
     bad_headers = {
@@ -1642,7 +2672,7 @@ class BaseResponse:
         assert issubclass(cls, BaseResponse)
         copy = cls()
         copy.status = self.status
-        copy._headers = dict((k, v[:]) for (k, v) in self._headers.items())
+        copy._headers = dict((k, list(v)) for (k, v) in self._headers.items())
         if self._cookies:
             cookies = copy._cookies = SimpleCookie()
             for k, v in self._cookies.items():
@@ -1740,18 +2770,34 @@ class BaseResponse:
     @property
     def headerlist(self):
         """ WSGI conform list of (header, value) tuples. """
-        out = []
-        headers = list(self._headers.items())
-        if 'Content-Type' not in self._headers:
-            headers.append(('Content-Type', [self.default_content_type]))
-        if self._status_code in self.bad_headers:
-            bad_headers = self.bad_headers[self._status_code]
-            headers = [h for h in headers if h[0] not in bad_headers]
-        out += [(name, val) for (name, vals) in headers for val in vals]
+        return self._headerlist()
+
+    def _headerlist(self, static=()):
+        """ Build the :attr:`headerlist`. `static` is a list of already
+            encoded (name, value) tuples that are added as they are, unless
+            the response defines a header with the same name. A static
+            Content-Type header must be the last item in the list. """
+        _headers, code = self._headers, self._status_code
+        # Non-ASCII values are re-encoded. isascii() is a constant time check.
+        out = [(name, val if val.isascii() else _wsgi_encode(val))
+               for (name, vals) in _headers.items() for val in vals]
+        frozen = self._frozen_headers
+        if frozen:
+            for name, headers in frozen.items():
+                if name not in _headers:
+                    out += headers
+        for header in static:
+            if header[0] not in _headers and header[0] not in frozen:
+                out.append(header)
+        if 'Content-Type' not in _headers and 'Content-Type' not in frozen \
+           and not (static and static[-1][0] == 'Content-Type'):
+            out.append(('Content-Type', _wsgi_encode(self.default_content_type)))
+        if code in self.bad_headers:
+            bad_headers = self.bad_headers[code]
+            out = [h for h in out if h[0] not in bad_headers]
         if self._cookies:
             for c in self._cookies.values():
-                out.append(('Set-Cookie', _hval(c.OutputString())))
-        out = [(k, v.encode('utf8', 'surrogateescape').decode('latin1')) for (k, v) in out]
+                out.append(('Set-Cookie', _wsgi_encode(_hval(c.OutputString()))))
         return out
 
     content_type = HeaderProperty('Content-Type')
@@ -1863,46 +2909,68 @@ class BaseResponse:
         return out
 
 
-def _local_property():
-    ls = threading.local()
+def _local_property(name, storage):
+    """ A property that stores its value in a dict held by a context variable.
+        Each thread and each asyncio task has its own context. Threads that
+        run with a copy of a context (see :meth:`Bottle.asgi`) share the same
+        dict and thus see the same values. """
 
-    def fget(_):
+    # Bound as default arguments to save a lookup on each (frequent) access.
+    def fget(_, get=storage.get, name=name):
         try:
-            return ls.var
-        except AttributeError:
+            return get()[name]
+        except LookupError:
             raise RuntimeError("Request context not initialized.")
 
-    def fset(_, value):
-        ls.var = value
+    def fset(_, value, get=storage.get, name=name):
+        try:
+            get()[name] = value
+        except LookupError:
+            storage.set({name: value})
 
     def fdel(_):
-        del ls.var
+        try:
+            del storage.get()[name]
+        except LookupError:
+            raise AttributeError(name)
 
-    return property(fget, fset, fdel, 'Thread-local property')
+    return property(fget, fset, fdel, 'Context-local property')
 
 
 class LocalRequest(BaseRequest):
-    """ A thread-local subclass of :class:`BaseRequest` with a different
-        set of attributes for each thread. There is usually only one global
-        instance of this class (:data:`request`). If accessed during a
-        request/response cycle, this instance always refers to the *current*
-        request (even on a multithreaded server). """
-    bind = BaseRequest.__init__
-    environ = _local_property()
+    """ A context-local subclass of :class:`BaseRequest` with a different
+        set of attributes for each thread or asyncio task. There is usually
+        only one global instance of this class (:data:`request`). If accessed
+        during a request/response cycle, this instance always refers to the
+        *current* request (even on a multithreaded or asynchronous server). """
+    _storage = contextvars.ContextVar('bottle.request')
+
+    def bind(self, environ=None):
+        self._storage.set({})
+        BaseRequest.__init__(self, environ)
+
+    environ = _local_property('environ', _storage)
 
 
 class LocalResponse(BaseResponse):
-    """ A thread-local subclass of :class:`BaseResponse` with a different
-        set of attributes for each thread. There is usually only one global
-        instance of this class (:data:`response`). Its attributes are used
-        to build the HTTP response at the end of the request/response cycle.
+    """ A context-local subclass of :class:`BaseResponse` with a different
+        set of attributes for each thread or asyncio task. There is usually
+        only one global instance of this class (:data:`response`). Its
+        attributes are used to build the HTTP response at the end of the
+        request/response cycle.
     """
-    bind = BaseResponse.__init__
-    _status_line = _local_property()
-    _status_code = _local_property()
-    _cookies = _local_property()
-    _headers = _local_property()
-    body = _local_property()
+    _storage = contextvars.ContextVar('bottle.response')
+
+    def bind(self, body='', status=None, headers=None, **more_headers):
+        self._storage.set({'_frozen_headers': ()})
+        BaseResponse.__init__(self, body, status, headers, **more_headers)
+
+    _status_line = _local_property('_status_line', _storage)
+    _frozen_headers = _local_property('_frozen_headers', _storage)
+    _status_code = _local_property('_status_code', _storage)
+    _cookies = _local_property('_cookies', _storage)
+    _headers = _local_property('_headers', _storage)
+    body = _local_property('body', _storage)
 
 
 Request = BaseRequest
@@ -1917,6 +2985,8 @@ class HTTPResponse(Response, BottleException):
         handlers.
     """
 
+    _frozen = False
+
     def __init__(self, body='', status=None, headers=None, **more_headers):
         super(HTTPResponse, self).__init__(body, status, headers, **more_headers)
 
@@ -1924,10 +2994,60 @@ class HTTPResponse(Response, BottleException):
         """ Copy the state of this response to a different :class:`Response` object. """
         other._status_code = self._status_code
         other._status_line = self._status_line
-        other._headers = self._headers
+        if not self._frozen:
+            other._headers = self._headers
+        elif other._frozen_headers is not self._frozen_headers:
+            # Not applied yet. Bottle applies responses twice (before and
+            # after the after_request hooks), changes in between are kept.
+            other._headers = {}
         other._cookies = self._cookies
+        other._frozen_headers = self._frozen_headers
         other.body = self.body
 
+    def freeze(self):
+        """ Return a copy of this response with a cached, pre-rendered
+            header list. The copy can be declared once and returned (or
+            raised) by many requests, e.g. for ``304 Not Modified``
+            responses or static error messages.
+
+            Headers and cookies are validated and encoded once. Returning the
+            copy from a request handler skips building and copying a new set
+            of headers for each request. The headers of the copy are read-only
+            and are not visible in the :data:`response` headers during the
+            request that returns it. Changes made to the global
+            :data:`response` are discarded, as usual for :class:`HTTPResponse`.
+            Status and body are not protected and must not be changed, because
+            the copy is shared between requests.
+
+            The body must be a string, bytes or a dict. Strings are encoded
+            with the charset of the response (except for :class:`HTTPError`,
+            where the body is passed to the error handler), dicts are
+            serialized to JSON.
+        """
+        headers = dict((k, tuple(v)) for (k, v) in self._headers.items())
+        if self._cookies:
+            headers['Set-Cookie'] = headers.get('Set-Cookie', ()) + tuple(
+                _hval(c.OutputString()) for c in self._cookies.values())
+        body = self.body
+        if isinstance(body, dict):
+            body = json_dumps(body)
+            headers.setdefault('Content-Type', ('application/json', ))
+        if isinstance(body, str):
+            # The body of an HTTPError is rendered by the error handler.
+            if not isinstance(self, HTTPError):
+                body = body.encode(self.charset)
+        elif body is not None and not isinstance(body, bytes):
+            raise TypeError('Cannot freeze a response with a %r body.' % type(body))
+
+        frozen = self.__class__.__new__(self.__class__)
+        frozen.__dict__.update(self.__dict__)
+        frozen.body, frozen._cookies, frozen._frozen = body, None, True
+        frozen._headers = MappingProxyType(headers)
+        frozen._frozen_headers = MappingProxyType(dict(
+            (name, [(name, _wsgi_encode(v)) for v in values])
+            for (name, values) in headers.items()))
+        return frozen
+
 
 class HTTPError(HTTPResponse):
     """ A subclass of :class:`HTTPResponse` that triggers error handlers. """
@@ -1975,13 +3095,7 @@ class JSONPlugin:
         dumps = self.json_dumps
         if not self.json_dumps: return callback
 
-        @functools.wraps(callback)
-        def wrapper(*a, **ka):
-            try:
-                rv = callback(*a, **ka)
-            except HTTPResponse as resp:
-                rv = resp
-
+        def encode(rv):
             if isinstance(rv, dict):
                 # Attempt to serialize, raises exception on failure
                 json_response = dumps(rv)
@@ -1993,6 +3107,26 @@ class JSONPlugin:
                 rv.content_type = 'application/json'
             return rv
 
+        if inspect.iscoroutinefunction(callback):
+
+            @functools.wraps(callback)
+            async def wrapper(*a, **ka):
+                try:
+                    rv = await callback(*a, **ka)
+                except HTTPResponse as resp:
+                    rv = resp
+                return encode(rv)
+
+            return wrapper
+
+        @functools.wraps(callback)
+        def wrapper(*a, **ka):
+            try:
+                rv = callback(*a, **ka)
+            except HTTPResponse as resp:
+                rv = resp
+            return encode(rv)
+
         return wrapper
 
 
@@ -2071,7 +3205,9 @@ class MultiDict(DictMixin):
     """
 
     def __init__(self, *a, **k):
-        self.dict = {key: [value] for key, value in dict(*a, **k).items()}
+        self.dict = {}
+        if a or k:
+            self.dict = {key: [value] for key, value in dict(*a, **k).items()}
 
     def __len__(self):
         return len(self.dict)
@@ -2119,15 +3255,21 @@ class MultiDict(DictMixin):
                     the default value to be returned.
         """
         try:
-            val = self.dict[key][index]
-            return type(val) if type else val
+            values = self.dict.get(key)
+            if values:
+                val = values[index]
+                return type(val) if type else val
         except Exception:
             pass
         return default
 
     def append(self, key, value):
         """ Add a new value to the list of values for this key. """
-        self.dict.setdefault(key, []).append(value)
+        values = self.dict.get(key)
+        if values is None:
+            self.dict[key] = [value]
+        else:
+            values.append(value)
 
     def replace(self, key, value):
         """ Replace the list of values with a single value. """
@@ -2172,6 +3314,85 @@ class FormsDict(MultiDict):
         return self.get(name, default=default)
 
 
+class _LazyFormsDict(FormsDict):
+    """ A :class:`FormsDict` for an url-encoded query string. Pairs are split
+        and keys are decoded up front, but values are only unquoted the first
+        time they are accessed. Keys in :attr:`_raw` still have a list of
+        undecoded values. """
+
+    def __init__(self, qs, encoding='utf8'):
+        self._raw, self._encoding = set(), encoding
+        self.dict = store = {}
+        for pair in qs.split('&'):
+            if not pair: continue
+            key, _, value = pair.partition('=')
+            if '%' in key or '+' in key:
+                key = urlunquote(key.replace('+', ' '), encoding)
+            if key in store:
+                store[key].append(value)
+            else:
+                store[key] = [value]
+        self._raw.update(store)
+
+    def _decode(self, key):
+        if key in self._raw:
+            self._raw.discard(key)
+            encoding = self._encoding
+            self.dict[key] = [urlunquote(v.replace('+', ' '), encoding)
+                              if '%' in v or '+' in v else v
+                              for v in self.dict[key]]
+
+    def _decode_all(self):
+        for key in list(self._raw):
+            self._decode(key)
+
+    def __delitem__(self, key):
+        self._raw.discard(key)
+        del self.dict[key]
+
+    def __getitem__(self, key):
+        if key in self._raw: self._decode(key)
+        return self.dict[key][-1]
+
+    def values(self):
+        self._decode_all()
+        return FormsDict.values(self)
+
+    def items(self):
+        self._decode_all()
+        return FormsDict.items(self)
+
+    def allitems(self):
+        self._decode_all()
+        return FormsDict.allitems(self)
+
+    iteritems = items
+    itervalues = values
+    iterallitems = allitems
+
+    def get(self, key, default=None, index=-1, type=None):
+        try:
+            if key in self._raw: self._decode(key)
+        except TypeError:  # Unhashable key
+            return default
+        return FormsDict.get(self, key, default, index, type)
+
+    def append(self, key, value):
+        if key in self._raw: self._decode(key)
+        FormsDict.append(self, key, value)
+
+    def replace(self, key, value):
+        self._raw.discard(key)
+        FormsDict.replace(self, key, value)
+
+    def getall(self, key):
+        if key in self._raw: self._decode(key)
+        return FormsDict.getall(self, key)
+
+    getone = get
+    getlist = getall
+
+
 class HeaderDict(MultiDict):
     """ A case-insensitive version of :class:`MultiDict` that defaults to
         replace the old value instead of appending it. """
@@ -2193,7 +3414,7 @@ class HeaderDict(MultiDict):
         self.dict[_hkey(key)] = [_hval(value)]
 
     def append(self, key, value):
-        self.dict.setdefault(_hkey(key), []).append(_hval(value))
+        MultiDict.append(self, _hkey(key), _hval(value))
 
     def replace(self, key, value):
         self.dict[_hkey(key)] = [_hval(value)]
@@ -2518,17 +3739,55 @@ class AppStack(list):
 
 
 class WSGIFileWrapper:
-    def __init__(self, fp, buffer_size=1024 * 64):
+    """ Iterate over a file-like object in chunks of `buffer_size` bytes.
+
+        If `offset` is given, the file is read from that position instead of
+        the current one. If `length` is given, at most that many bytes are
+        returned. Of the server adapters that ship with bottle, only
+        ``wsgiref`` skips iteration and calls :meth:`sendfile` instead. Other
+        servers iterate over the wrapper or use their own file handling. """
+
+    def __init__(self, fp, buffer_size=1024 * 64, offset=None, length=None):
         self.fp, self.buffer_size = fp, buffer_size
+        self.offset, self.length = offset, length
         for attr in 'fileno', 'close', 'read', 'readlines', 'tell', 'seek':
             if hasattr(fp, attr): setattr(self, attr, getattr(fp, attr))
 
     def __iter__(self):
-        buff, read = self.buffer_size, self.read
-        part = read(buff)
-        while part:
-            yield part
+        buff, read, limit = self.buffer_size, self.read, self.length
+        if self.offset is not None:
+            self.seek(self.offset)
+        if limit is None:
             part = read(buff)
+            while part:
+                yield part
+                part = read(buff)
+        else:
+            while limit > 0:
+                part = read(min(limit, buff))
+                if not part:
+                    break
+                limit -= len(part)
+                yield part
+
+    def sendfile(self, sock):
+        """ Send the file (or the selected part of it) to a connected socket
+            with :meth:`socket.socket.sendfile`, which uses the zero-copy
+            :func:`os.sendfile` where available. Return the number of bytes
+            sent, or None (without sending anything) if the wrapped object is
+            not a seekable file with a descriptor. Only the ``wsgiref`` server
+            adapter calls this method. """
+        fp = self.fp
+        try:
+            fp.fileno()
+            if not fp.seekable():
+                return None
+            offset = fp.tell() if self.offset is None else self.offset
+        except (AttributeError, OSError, ValueError):
+            return None
+        if self.length == 0:
+            return 0
+        return sock.sendfile(fp, offset, self.length)
 
 
 class _closeiter:
@@ -2728,15 +3987,440 @@ def redirect(url, code=None):
     raise res
 
 
-def _rangeiter(fp, offset, limit, bufsize=1024 * 1024):
-    """ Yield chunks from a range in a file. """
-    fp.seek(offset)
-    while limit > 0:
-        part = fp.read(min(limit, bufsize))
-        if not part:
-            break
-        limit -= len(part)
-        yield part
+class _StaticFile:
+    """ Metadata of a file served by :func:`static_file`. """
+    __slots__ = ('path', 'key', 'checked', 'wd', 'size', 'mtime',
+                 'last_modified', '_etag', '_headers', 'data', 'gzip')
+
+    def __init__(self, path, stats):
+        self.path, self.key = path, _StaticFile.stat_key(stats)
+        self.checked, self.wd = time.monotonic(), None
+        self.size, self.mtime = stats.st_size, stats.st_mtime
+        self.last_modified = email.utils.formatdate(stats.st_mtime, usegmt=True)
+        self._etag, self._headers = None, {}
+        self.data = None  # File content, if cached in memory.
+        self.gzip = None  # Compressed content, or b'' if not worth it.
+
+    @staticmethod
+    def stat_key(stats):
+        return (stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime_ns,
+                stats.st_ctime_ns)
+
+    @property
+    def etag(self):
+        if self._etag is None:
+            dev, ino, size = self.key[:3]
+            etag = '%d:%d:%d:%d:%s' % (dev, ino, self.mtime, size, self.path)
+            self._etag = hashlib.sha1(tob(etag)).hexdigest()
+        return self._etag
+
+    def headers(self, mimetype=True, download=False, charset='UTF-8', etag=None):
+        """ Return a (shared) dict of headers for this file. """
+        args = (mimetype, download, charset, etag)
+        try:
+            return self._headers[args]
+        except KeyError:
+            pass
+        headers = {}
+
+        if mimetype is True:
+            name = download if isinstance(download, str) else self.path
+            mimetype, encoding = mimetypes.guess_type(name)
+            if encoding == 'gzip':
+                mimetype = 'application/gzip'
+            elif encoding:  # e.g. bzip2 -> application/x-bzip2
+                mimetype = 'application/x-' + encoding
+
+        if charset and mimetype and 'charset=' not in mimetype \
+           and (mimetype[:5] == 'text/' or mimetype == 'application/javascript'):
+            mimetype += '; charset=%s' % charset
+
+        if mimetype:
+            headers['Content-Type'] = mimetype
+
+        if download is True:
+            download = os.path.basename(self.path)
+
+        if download:
+            download = download.replace('"', '')
+            headers['Content-Disposition'] = 'attachment; filename="%s"' % download
+
+        headers['Content-Length'] = str(self.size)
+        headers['Last-Modified'] = self.last_modified
+
+        if etag is None:
+            etag = self.etag
+        if etag:
+            headers['ETag'] = etag
+
+        headers = {_hkey(name): _hval(value) for name, value in headers.items()}
+
+        if len(self._headers) >= 8:
+            self._headers.clear()
+        self._headers[args] = headers
+        return headers
+
+
+class _Inotify:
+    """ Minimal ctypes binding for the Linux inotify API. A daemon thread
+        calls `callback(paths)` whenever a watched file is changed, moved or
+        deleted. The watch is removed afterwards and has to be added again. """
+
+    MASK = 0x2 | 0x4 | 0x8 | 0x400 | 0x800  # MODIFY ATTRIB CLOSE_WRITE *_SELF
+    IGNORED = 0x8000
+
+    def __init__(self, callback):
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch, self._rm_watch = libc.inotify_add_watch, libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+        self.callback = callback
+        self.watches = {}  # Maps watch descriptors to sets of paths.
+        self.events = 0  # Number of change events seen so far.
+        self.closed = False
+        thread = threading.Thread(target=self._run, name='bottle-inotify')
+        thread.daemon = True
+        thread.start()
+
+    def add(self, path):
+        """ Watch a file and return the watch descriptor, or None. """
+        wd = self._add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            return None
+        self.watches.setdefault(wd, set()).add(path)
+        return wd
+
+    def discard(self, wd, path):
+        """ Stop watching a path. """
+        paths = self.watches.get(wd)
+        if paths is not None:
+            paths.discard(path)
+            if not paths and self.watches.pop(wd, None) is not None:
+                self._rm_watch(self.fd, wd)
+
+    def close(self):
+        """ Remove all watches and stop the background thread. """
+        self.closed = True
+        # Removing a watch queues an event, which wakes up the thread.
+        wds = list(self.watches) + [self._add_watch(self.fd, b'/', 0x4)]
+        self.watches.clear()
+        for wd in wds:
+            self._rm_watch(self.fd, wd)
+
+    def _run(self):
+        import struct
+        header = struct.Struct('iIII')
+        while not self.closed:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except InterruptedError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, size = header.unpack_from(data, offset)
+                offset += header.size + size
+                paths = self.watches.pop(wd, None)
+                if paths is None:
+                    continue
+                if not mask & self.IGNORED:
+                    self._rm_watch(self.fd, wd)
+                self.events += 1  # After the watch is gone, see StaticCache
+                self.callback(paths)
+        os.close(self.fd)
+
+
+class StaticCache:
+    """ A bounded cache for :func:`static_file`. Pass an instance as the
+        ``cache`` parameter to skip most of the file system calls and header
+        formatting for frequently requested files::
+
+            static_cache = StaticCache(revalidate='inotify')
+
+            @route('/static/<filepath:path>')
+            def static(filepath):
+                return static_file(filepath, root='/srv/static', cache=static_cache)
+
+        Entries are keyed by the resolved file path and store the size,
+        ``Last-Modified`` date, ``ETag`` and the formatted response headers.
+        If ``max_bytes`` is set, the content of small files is kept in memory,
+        too, so they are served without opening the file. With ``compress``,
+        files that are kept in memory and have a compressible type (see
+        :attr:`compress_types`) are also gzip-compressed once and sent to
+        clients that accept it.
+
+        :param maxsize: Maximum number of cached files (LRU eviction).
+        :param revalidate: How to detect changed files. ``mtime`` (default)
+            runs a single :func:`os.stat` per request and compares it with the
+            cached one. ``ttl`` trusts an entry for ``ttl`` seconds before it
+            is checked again. ``inotify`` (Linux only) watches the cached
+            files and checks nothing per request. It falls back to ``mtime``
+            if inotify is not available.
+        :param ttl: Seconds between checks in ``ttl`` mode.
+        :param max_bytes: Total size of file contents to keep in memory (LRU
+            eviction). Zero disables the content cache. (default: 0)
+        :param max_file_size: Files larger than this are never kept in
+            memory. (default: 64KB)
+        :param compress: Serve gzip-compressed content from memory.
+            Compressed content counts towards ``max_bytes``. (default: False)
+    """
+
+    #: Content-Type prefixes that are compressed in ``compress`` mode.
+    compress_types = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+
+    def __init__(self, maxsize=1024, revalidate='mtime', ttl=1.0,
+                 max_bytes=0, max_file_size=1024 * 64, compress=False):
+        if revalidate not in ('mtime', 'ttl', 'inotify'):
+            raise ValueError("Unknown revalidation mode: %r" % revalidate)
+        self.maxsize, self.ttl = maxsize, ttl
+        self.max_bytes, self.max_file_size = max_bytes, max_file_size
+        self.compress = compress
+        self.cached_bytes = 0  #: Total size of file contents in memory.
+        self._data = OrderedDict()  # Entries with content, in LRU order.
+        self._lock = threading.Lock()
+        self.inotify = None
+        if revalidate == 'inotify':
+            try:
+                self.inotify = _Inotify(self._on_change)
+            except (OSError, AttributeError, TypeError):
+                revalidate = 'mtime'
+        self.revalidate = revalidate
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, path):
+        """ Return a :class:`_StaticFile` for a path, or None if the path is
+            not a readable regular file. """
+        entry = self._entries.get(path)
+        if entry is None:
+            return self._load(path)
+        if self.revalidate == 'ttl':
+            check = time.monotonic() - entry.checked >= self.ttl
+        else:  # Only inotify entries have a watch descriptor.
+            check = entry.wd is None
+        if check:
+            try:
+                key = _StaticFile.stat_key(os.stat(path))
+            except OSError:
+                key = None
+            if key != entry.key:
+                self.discard(path)
+                return self._load(path)
+            entry.checked = time.monotonic()
+        try:
+            self._entries.move_to_end(path)
+        except KeyError:  # Removed by a different thread
+            pass
+        self.hits += 1
+        return entry
+
+    def _load(self, path):
+        self.misses += 1
+        inotify = self.inotify
+        if inotify is not None:
+            events, wd = inotify.events, inotify.add(path)
+        try:
+            stats = os.stat(path)
+        except OSError:
+            stats = None
+        if stats is None or not S_ISREG(stats.st_mode) \
+           or not os.access(path, os.R_OK):
+            if inotify is not None and wd is not None:
+                inotify.discard(wd, path)
+            return None
+        entry = _StaticFile(path, stats)
+        if inotify is not None:
+            entry.wd = wd
+        self._entries[path] = entry
+        if inotify is not None and inotify.events != events:
+            self.discard(path)  # Changed while loading. Check again next time.
+        while len(self._entries) > self.maxsize:
+            try:
+                self._drop(self._entries.popitem(last=False)[1])
+            except KeyError:  # Emptied by a different thread
+                break
+        return entry
+
+    def read(self, entry, encoding=None):
+        """ Return the content of a file as bytes, if it is small enough to
+            be kept in memory. Otherwise, return None. If `encoding` is
+            ``gzip``, return the compressed content instead, or None if it
+            is not smaller than the original. """
+        if encoding == 'gzip':
+            return self._read_gzip(entry)
+        data = entry.data
+        if data is not None:
+            try:
+                self._data.move_to_end(entry.path)
+            except KeyError:  # Removed by a different thread
+                pass
+            return data
+        if entry.size > min(self.max_bytes, self.max_file_size):
+            return None
+        try:
+            with open(entry.path, 'rb') as fp:
+                data = fp.read(entry.size + 1)
+                stats = os.fstat(fp.fileno())
+        except OSError:
+            return None
+        if len(data) != entry.size or _StaticFile.stat_key(stats) != entry.key:
+            return None  # Changed since it was cached.
+        with self._lock:
+            if self._entries.get(entry.path) is entry and entry.data is None:
+                old = self._data.pop(entry.path, None)
+                if old is not None:  # Replaced by a different thread
+                    self._drop_data(old)
+                entry.data = data
+                self._data[entry.path] = entry
+                self.cached_bytes += len(data)
+                while self.cached_bytes > self.max_bytes:
+                    self._drop_data(self._data.popitem(last=False)[1])
+        return data
+
+    def _read_gzip(self, entry):
+        data = entry.gzip
+        if data is not None:
+            try:
+                self._data.move_to_end(entry.path)
+            except KeyError:  # Removed by a different thread
+                pass
+            return data or None
+        raw = self.read(entry)
+        if raw is None:
+            return None
+        import gzip
+        data = gzip.compress(raw, mtime=0)
+        if len(data) >= len(raw):
+            data = b''
+        with self._lock:
+            if self._data.get(entry.path) is entry and entry.gzip is None:
+                entry.gzip = data
+                self.cached_bytes += len(data)
+                while self.cached_bytes > self.max_bytes:
+                    self._drop_data(self._data.popitem(last=False)[1])
+        return data or None
+
+    def discard(self, path):
+        """ Remove a path from the cache, if present. """
+        self._drop(self._entries.pop(path, None))
+
+    def clear(self):
+        """ Remove all entries. """
+        while self._entries:
+            try:
+                self._drop(self._entries.popitem()[1])
+            except KeyError:
+                break
+
+    def close(self):
+        """ Remove all entries and stop watching files. """
+        self.clear()
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def _drop(self, entry):
+        if entry is None:
+            return
+        if entry.wd is not None and self.inotify:
+            self.inotify.discard(entry.wd, entry.path)
+        if entry.data is not None:
+            with self._lock:
+                if self._data.get(entry.path) is entry:
+                    del self._data[entry.path]
+                    self._drop_data(entry)
+
+    def _drop_data(self, entry):
+        self.cached_bytes -= len(entry.data) + len(entry.gzip or b'')
+        entry.data = entry.gzip = None
+
+    def _on_change(self, paths):
+        for path in paths:
+            self.discard(path)
+
+
+_date_cache = [None, None]
+
+
+def _http_date_now():
+    """ Return the current time as an HTTP date, formatted at most once per
+        second. """
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[:] = now, email.utils.formatdate(now, usegmt=True)
+    return _date_cache[1]
+
+
+#: Content-codings of precompressed files, in order of preference.
+_STATIC_ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+_accept_encoding_cache = {}
+
+
+def _accepted_encodings(header):
+    """ Return the codings from :data:`_STATIC_ENCODINGS` that are allowed by
+        an ``Accept-Encoding`` header, in order of preference. """
+    accepted = _accept_encoding_cache.get(header)
+    if accepted is None:
+        qvalues = {}
+        for part in header.split(','):
+            coding, _, params = part.partition(';')
+            params, q = params.strip().lower(), 1.0
+            if params.startswith('q='):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            qvalues[coding.strip().lower()] = q
+        qvalues.setdefault('gzip', qvalues.get('x-gzip', qvalues.get('*', 0)))
+        star = qvalues.get('*', 0)
+        accepted = tuple(c for c in _STATIC_ENCODINGS if qvalues.get(c, star) > 0)
+        if len(_accept_encoding_cache) < _HEADER_CACHE_MAX:
+            _accept_encoding_cache[header] = accepted
+    return accepted
+
+
+def _static_variant(path, original, cache):
+    """ Return a :class:`_StaticFile` for a precompressed variant of a file,
+        or None if it does not exist or is older than the original. """
+    if cache is not None:
+        variant = cache.get(path)
+    else:
+        try:
+            stats = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISREG(stats.st_mode) or not os.access(path, os.R_OK):
+            return None
+        variant = _StaticFile(path, stats)
+    if variant is not None and variant.mtime >= original.mtime:
+        return variant
+
+
+def _coalesce_ranges(ranges, gap=80):
+    """ Sort (start, end) ranges and merge the ones that overlap or are less
+        than `gap` bytes apart (about the overhead of an additional part in a
+        multipart response). """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _iter_byteranges(source, parts, tail):
+    """ Yield a multipart/byteranges body. `source` is either the file content
+        as bytes or an open file, `parts` a list of (head, start, end) tuples
+        and `tail` the closing boundary. """
+    for head, start, end in parts:
+        yield head
+        if isinstance(source, bytes):
+            yield source[start:end]
+        else:
+            yield from WSGIFileWrapper(source, 1024 * 1024, start, end - start)
+    yield tail
 
 
 def static_file(filename, root,
@@ -2744,7 +4428,10 @@ def static_file(filename, root,
                 download=False,
                 charset='UTF-8',
                 etag=None,
-                headers=None):
+                headers=None,
+                cache=None,
+                precompressed=False,
+                max_ranges=16):
     """ Open a file in a safe way and return an instance of :exc:`HTTPResponse`
         that can be sent back to the client.
 
@@ -2762,6 +4449,14 @@ def static_file(filename, root,
         :param etag: Provide a pre-computed ETag header. If set to ``False``,
             ETag handling is disabled. (default: auto-generate ETag header)
         :param headers: Additional headers dict to add to the response.
+        :param cache: A :class:`StaticCache` instance to look up file metadata
+            and headers in. (default: no caching)
+        :param precompressed: Look for ``.br`` and ``.gz`` files next to the
+            requested file and send them to clients that accept the encoding,
+            if they are not older than the original. (default: False)
+        :param max_ranges: Maximum number of parts in a ``multipart/byteranges``
+            response. Requests for more ranges (after overlapping and adjacent
+            ranges are merged) get the complete file instead. (default: 16)
 
         While checking user input is always a good idea, this function provides
         additional protection against malicious ``filename`` parameters from
@@ -2774,79 +4469,137 @@ def static_file(filename, root,
         ``If-None-Match``) are answered with ``304 Not Modified`` whenever
         possible. ``HEAD`` and ``Range`` requests (used by download managers to
         check or continue partial downloads) are also handled automatically.
+        Requests for multiple ranges are answered with a ``multipart/byteranges``
+        response.
     """
 
     root = os.path.join(os.path.abspath(root), '')
     filename = os.path.abspath(os.path.join(root, filename.strip('/\\')))
-    headers = headers.copy() if headers else {}
     getenv = request.environ.get
 
     if not filename.startswith(root):
         return HTTPError(403, "Access denied.")
-    if not os.path.isfile(filename):
-        return HTTPError(404, "File does not exist.")
-    if not os.access(filename, os.R_OK):
-        return HTTPError(403, "You do not have permission to access this file.")
-
-    if mimetype is True:
-        name = download if isinstance(download, str) else filename
-        mimetype, encoding = mimetypes.guess_type(name)
-        if encoding == 'gzip':
-            mimetype = 'application/gzip'
-        elif encoding:  # e.g. bzip2 -> application/x-bzip2
-            mimetype = 'application/x-' + encoding
-
-    if charset and mimetype and 'charset=' not in mimetype \
-       and (mimetype[:5] == 'text/' or mimetype == 'application/javascript'):
-        mimetype += '; charset=%s' % charset
-
-    if mimetype:
-        headers['Content-Type'] = mimetype
-
-    if download is True:
-        download = os.path.basename(filename)
-
-    if download:
-        download = download.replace('"', '')
-        headers['Content-Disposition'] = 'attachment; filename="%s"' % download
-
-    stats = os.stat(filename)
-    headers['Content-Length'] = clen = stats.st_size
-    headers['Last-Modified'] = email.utils.formatdate(stats.st_mtime, usegmt=True)
-    headers['Date'] = email.utils.formatdate(time.time(), usegmt=True)
-
-    if etag is None:
-        etag = '%d:%d:%d:%d:%s' % (stats.st_dev, stats.st_ino, stats.st_mtime,
-                                   clen, filename)
-        etag = hashlib.sha1(tob(etag)).hexdigest()
-
+    stats = cache.get(filename) if cache is not None else None
+    if stats is None:
+        if not os.path.isfile(filename):
+            return HTTPError(404, "File does not exist.")
+        if not os.access(filename, os.R_OK):
+            return HTTPError(403, "You do not have permission to access this file.")
+        stats = _StaticFile(filename, os.stat(filename))
+
+    meta = stats.headers(mimetype, download, charset, etag)
+    source, data = stats, None
+
+    # Compressed variants: Precompressed files next to the original, or
+    # content that was compressed once and kept in memory by the cache.
+    compress = cache is not None and cache.compress \
+        and meta.get('Content-Type', '').startswith(cache.compress_types)
+    if precompressed or compress:
+        accepted = _accepted_encodings(getenv('HTTP_ACCEPT_ENCODING', ''))
+        encoding = None
+        if precompressed:
+            for encoding in accepted:
+                path = filename + _STATIC_ENCODINGS[encoding]
+                source = _static_variant(path, stats, cache) or stats
+                if source is not stats:
+                    break
+            else:
+                encoding = None
+        if encoding is None and compress and 'gzip' in accepted:
+            data = cache.read(stats, 'gzip')
+            encoding = data and 'gzip'
+        if encoding:
+            meta = dict(meta)
+            meta['Content-Encoding'] = encoding
+            meta['Content-Length'] = str(source.size if data is None else len(data))
+            if 'Etag' in meta:
+                if etag is None and source is not stats:
+                    meta['Etag'] = source.etag
+                else:
+                    meta['Etag'] += '-' + encoding
+
+    # Headers from the file metadata are already validated and replace any
+    # user-provided headers with the same name.
+    out = HTTPResponse(headers=headers)
+    out_headers = out._headers
+    for name, value in meta.items():
+        out_headers[name] = [value]
+    out_headers['Date'] = [_http_date_now()]
+    if precompressed or compress:
+        vary = out_headers.get('Vary')
+        if not vary:
+            out_headers['Vary'] = ['Accept-Encoding']
+        elif 'accept-encoding' not in vary[-1].lower():
+            vary[-1] += ', Accept-Encoding'
+    clen = source.size if data is None else len(data)
+
+    etag = meta.get('Etag')
     if etag:
-        headers['ETag'] = etag
         check = getenv('HTTP_IF_NONE_MATCH')
         if check and check == etag:
-            return HTTPResponse(status=304, **headers)
+            out.status = 304
+            return out
 
     ims = getenv('HTTP_IF_MODIFIED_SINCE')
     if ims:
         ims = parse_date(ims.split(";")[0].strip())
-        if ims is not None and ims >= int(stats.st_mtime):
-            return HTTPResponse(status=304, **headers)
+        if ims is not None and ims >= int(stats.mtime):
+            out.status = 304
+            return out
 
-    body = '' if request.method == 'HEAD' else open(filename, 'rb')
+    # Small files may be served from memory, all others are opened below.
+    if request.method == 'HEAD':
+        data = None
+    elif data is None and cache is not None:
+        data = cache.read(source)
 
-    headers["Accept-Ranges"] = "bytes"
+    out_headers['Accept-Ranges'] = ['bytes']
     range_header = getenv('HTTP_RANGE')
     if range_header:
         ranges = list(parse_range_header(range_header, clen))
         if not ranges:
             return HTTPError(416, "Requested Range Not Satisfiable")
+        ranges = _coalesce_ranges(ranges)
+
+    if range_header and len(ranges) == 1:
         offset, end = ranges[0]
         rlen = end - offset
-        headers["Content-Range"] = "bytes %d-%d/%d" % (offset, end - 1, clen)
-        headers["Content-Length"] = str(rlen)
-        if body: body = _closeiter(_rangeiter(body, offset, rlen), body.close)
-        return HTTPResponse(body, status=206, **headers)
-    return HTTPResponse(body, **headers)
+        out_headers['Content-Range'] = ["bytes %d-%d/%d" % (offset, end - 1, clen)]
+        out_headers['Content-Length'] = [str(rlen)]
+        out.status = 206
+        if data is not None:
+            out.body = data[offset:end]
+        elif request.method != 'HEAD':
+            fp = open(source.path, 'rb')
+            out.body = WSGIFileWrapper(fp, 1024 * 1024, offset, rlen)
+        return out
+
+    if range_header and len(ranges) <= max_ranges:
+        boundary = os.urandom(16).hex()
+        part_type = 'Content-Type: %s\r\n' % meta['Content-Type'] \
+                    if 'Content-Type' in meta else ''
+        parts, size = [], 0
+        for start, end in ranges:
+            head = tob('%s--%s\r\n%sContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+                '\r\n' if parts else '', boundary, part_type, start, end - 1, clen))
+            parts.append((head, start, end))
+            size += len(head) + end - start
+        tail = tob('\r\n--%s--\r\n' % boundary)
+        out_headers['Content-Type'] = ['multipart/byteranges; boundary=' + boundary]
+        out_headers['Content-Length'] = [str(size + len(tail))]
+        out.status = 206
+        if data is not None:
+            out.body = _iter_byteranges(data, parts, tail)
+        elif request.method != 'HEAD':
+            fp = open(source.path, 'rb')
+            out.body = _closeiter(_iter_byteranges(fp, parts, tail), fp.close)
+        return out
+
+    if data is not None:
+        out.body = data
+    elif request.method != 'HEAD':
+        out.body = open(source.path, 'rb')
+    return out
 
 ###############################################################################
 # HTTP Utilities and MISC (TODO) ###############################################
@@ -3420,13 +5173,48 @@ class WSGIRefServer(ServerAdapter):
     def run(self, app):  # pragma: no cover
         from wsgiref.simple_server import make_server
         from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+        from wsgiref.simple_server import ServerHandler
         import socket
 
+        class FileServerHandler(ServerHandler):
+            """ Send :class:`WSGIFileWrapper` responses with sendfile(). """
+            wsgi_file_wrapper = WSGIFileWrapper
+
+            def __init__(other, connection, *args, **kwargs):
+                ServerHandler.__init__(other, *args, **kwargs)
+                other.connection = connection
+
+            def sendfile(other):
+                if not other.headers_sent:
+                    other.send_headers()
+                other.stdout.flush()
+                sent = other.result.sendfile(other.connection)
+                if sent is None:
+                    return False
+                other.bytes_sent += sent
+                return True
+
         class FixedHandler(WSGIRequestHandler):
             def log_message(other, format, *args):
                 if not self.quiet:
                     return WSGIRequestHandler.log_message(other, format, *args)
 
+            def handle(other):
+                """ Same as WSGIRequestHandler.handle(), but with a
+                    ServerHandler that knows the connection socket. """
+                other.raw_requestline = other.rfile.readline(65537)
+                if len(other.raw_requestline) > 65536:
+                    other.requestline = other.request_version = other.command = ''
+                    other.send_error(414)
+                    return
+                if not other.parse_request():
+                    return
+                handler = FileServerHandler(
+                    other.connection, other.rfile, other.wfile,
+                    other.get_stderr(), other.get_environ(), multithread=False)
+                handler.request_handler = other
+                handler.run(other.server.get_app())
+
         handler_cls = self.options.get('handler_class', FixedHandler)
         server_cls = self.options.get('server_class', WSGIServer)
 
@@ -3717,6 +5505,18 @@ class AiohttpUVLoopServer(AiohttpServer):
         return uvloop.new_event_loop()
 
 
+class UvicornServer(ServerAdapter):
+    """ Runs the application on an asyncio event loop via its ASGI interface
+        (see :meth:`Bottle.asgi`). https://www.uvicorn.org/ """
+
+    def run(self, handler):
+        import uvicorn
+        if not isinstance(handler, Bottle):
+            raise TypeError('The uvicorn server adapter requires a Bottle application.')
+        uvicorn.run(handler.asgi, host=self.host, port=self.port,
+                    log_level='warning' if self.quiet else 'info', **self.options)
+
+
 class AutoServer(ServerAdapter):
     """ Untested. """
     adapters = [WaitressServer, PasteServer, TwistedServer, CherryPyServer,
@@ -3750,6 +5550,7 @@ server_names = {
     'bjoern': BjoernServer,
     'aiohttp': AiohttpServer,
     'uvloop': AiohttpUVLoopServer,
+    'uvicorn': UvicornServer,
     'auto': AutoServer,
 }
 
@@ -4416,18 +6217,28 @@ def view(tpl_name, **defaults):
             for instance, JSON with autojson or other castfilters.
     """
 
+    def render(result):
+        if isinstance(result, (dict, DictMixin)):
+            tplvars = defaults.copy()
+            tplvars.update(result)
+            return template(tpl_name, **tplvars)
+        elif result is None:
+            return template(tpl_name, **defaults)
+        return result
+
     def decorator(func):
 
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return render(await func(*args, **kwargs))
+
+            return wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            result = func(*args, **kwargs)
-            if isinstance(result, (dict, DictMixin)):
-                tplvars = defaults.copy()
-                tplvars.update(result)
-                return template(tpl_name, **tplvars)
-            elif result is None:
-                return template(tpl_name, **defaults)
-            return result
+            return render(func(*args, **kwargs))
 
         return wrapper
 
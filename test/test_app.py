@@ -18,3 +18,34 @@ class TestApplicationObject(unittest.TestCase):
         del app.test
         app.test = 6
         self.assertEqual(6, app.test)
+
+    def test_router_mode(self):
+        """ The router mode is selected via app config. """
+        app = Bottle()
+        self.assertEqual('regex', app.router.mode)
+        app.route('/<name>', callback=lambda name: name)
+        app.route('/<name>', host='example.com', callback=lambda name: name)
+        app.config['router.mode'] = 'trie'
+        self.assertEqual('trie', app.router.mode)
+        self.assertEqual('trie', app.host_routers['example.com'].mode)
+        route, args = app.router.match({'PATH_INFO': '/x', 'REQUEST_METHOD': 'GET'})
+        self.assertEqual({'name': 'x'}, args)
+        self.assertRaises(Exception, app.config.__setitem__, 'router.mode', 'x')
+        self.assertEqual('trie', app.config['router.mode'])
+
+    def test_router_cache(self):
+        """ The router cache size is configured via app config. """
+        app = Bottle()
+        self.assertEqual(0, app.router.cache_size)
+        app.config['router.cache'] = '100'
+        self.assertEqual(100, app.router.cache_size)
+
+    def test_router_profile(self):
+        """ The router profiler is enabled via app config. """
+        app = Bottle()
+        app.route('/', host='example.com', callback=lambda: 'ok')
+        self.assertFalse(app.router.profile)
+        app.config['router.profile'] = True
+        self.assertTrue(app.router.profile)
+        self.assertTrue(app.host_routers['example.com'].profile)
+        self.assertEqual(0, app.router.stats()['matches'])
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import unittest
+
+import bottle
+from bottle import tob
+
+
+class TestASGI(unittest.TestCase):
+    def setUp(self):
+        self.app = bottle.Bottle()
+
+    def request(self, path, method='GET', body=b'', headers=(), query=b''):
+        scope = {'type': 'http', 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'root_path': '',
+                 'query_string': query, 'server': ('localhost', 8080),
+                 'client': ('127.0.0.1', 12345),
+                 'headers': [(tob(k.lower()), tob(v)) for k, v in headers]}
+        return asyncio.run(self.call(scope, [body[:3], body[3:]]))
+
+    async def call(self, scope, chunks):
+        sent = []
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {'type': 'http.request', 'body': chunk,
+                    'more_body': bool(chunks)}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app.asgi(scope, receive, send)
+        start = sent[0]
+        self.assertEqual('http.response.start', start['type'])
+        self.assertFalse(sent[-1].get('more_body'))
+        headers = dict((k.decode('latin1').title(), v.decode('latin1'))
+                       for k, v in start['headers'])
+        body = b''.join(m.get('body', b'') for m in sent[1:])
+        return start['status'], headers, body
+
+    def test_sync_route(self):
+        @self.app.route('/hello/<name>')
+        def hello(name):
+            return 'Hello %s %s' % (name, threading.current_thread().name)
+        status, headers, body = self.request('/hello/world')
+        self.assertEqual(200, status)
+        self.assertTrue(body.startswith(b'Hello world '))
+        self.assertNotEqual(threading.current_thread().name, body.split()[-1])
+        self.assertEqual(str(len(body)), headers['Content-Length'])
+
+    def test_async_route(self):
+        @self.app.route('/async')
+        async def handler():
+            await asyncio.sleep(0)
+            bottle.response.set_header('X-Test', 'async')
+            return {'path': bottle.request.path}
+        status, headers, body = self.request('/async')
+        self.assertEqual(200, status)
+        self.assertEqual('application/json', headers['Content-Type'])
+        self.assertEqual('async', headers['X-Test'])
+        self.assertEqual(b'{"path": "/async"}', body)
+
+    def test_async_template(self):
+        @self.app.route('/tpl', template='Hello {{name}}')
+        async def handler():
+            return dict(name='world')
+        self.assertEqual(b'Hello world', self.request('/tpl')[2])
+
+    def test_async_iterator(self):
+        @self.app.route('/stream')
+        async def handler():
+            async def stream():
+                yield 'a'
+                yield b'b'
+            return stream()
+        self.assertEqual(b'ab', self.request('/stream')[2])
+
+    def test_generator(self):
+        @self.app.route('/gen')
+        def handler():
+            yield 'a'
+            yield 'b'
+        self.assertEqual(b'ab', self.request('/gen')[2])
+
+    def test_hooks(self):
+        calls = []
+
+        @self.app.hook('before_request')
+        async def before():
+            calls.append('before')
+
+        @self.app.hook('after_request')
+        def after():
+            calls.append('after')
+            bottle.response.set_header('X-Hook', 'after')
+
+        self.app.route('/', callback=lambda: 'ok')
+        status, headers, body = self.request('/')
+        self.assertEqual(['before', 'after'], calls)
+        self.assertEqual('after', headers['X-Hook'])
+
+    def test_sync_hooks_in_thread(self):
+        main = threading.current_thread().name
+        threads = []
+
+        @self.app.hook('before_request')
+        def before():
+            threads.append(threading.current_thread().name)
+
+        @self.app.hook('after_request')
+        def after():
+            threads.append(threading.current_thread().name)
+
+        self.app.route('/', callback=lambda: 'ok')
+        self.assertEqual(200, self.request('/')[0])
+        self.assertEqual(2, len(threads))
+        self.assertNotIn(main, threads)
+
+    def test_response_with_generator_body(self):
+        main = threading.current_thread().name
+        threads = []
+
+        @self.app.route('/')
+        def handler():
+            def stream():
+                threads.append(threading.current_thread().name)
+                yield 'a'
+                yield 'b'
+            return bottle.HTTPResponse(stream(), status=201, X_Test='1')
+        status, headers, body = self.request('/')
+        self.assertEqual(201, status)
+        self.assertEqual('1', headers['X-Test'])
+        self.assertEqual(b'ab', body)
+        self.assertNotIn(main, threads)
+
+    def test_lowercase_header_names(self):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        self.app.route('/', callback=lambda: 'ok')
+        scope = {'type': 'http', 'method': 'GET', 'path': '/',
+                 'query_string': b'', 'headers': []}
+        asyncio.run(self.app.asgi(scope, receive, send))
+        names = [name for name, value in sent[0]['headers']]
+        self.assertIn(b'content-type', names)
+        self.assertEqual([n.lower() for n in names], names)
+
+    def test_request_body(self):
+        @self.app.post('/post')
+        def handler():
+            return '%s %s %s' % (bottle.request.forms['a'],
+                                 bottle.request.query['q'],
+                                 bottle.request.get_header('X-Test'))
+        status, headers, body = self.request(
+            '/post', 'POST', b'a=value', query=b'q=query',
+            headers=[('Content-Type', 'application/x-www-form-urlencoded'),
+                     ('X-Test', '1'), ('X-Test', '2')])
+        self.assertEqual(b'value query 1, 2', body)
+
+    def test_errors(self):
+        @self.app.route('/error')
+        async def handler():
+            raise ValueError('fail')
+        self.app.route('/abort', callback=lambda: bottle.abort(401))
+        self.assertEqual(404, self.request('/missing')[0])
+        self.assertEqual(405, self.request('/abort', 'POST')[0])
+        self.assertEqual(401, self.request('/abort')[0])
+        self.assertEqual(500, self.request('/error')[0])
+        self.app.catchall = False
+        self.assertRaises(ValueError, self.request, '/error')
+
+    def test_head(self):
+        self.app.route('/', callback=lambda: 'body')
+        status, headers, body = self.request('/', 'HEAD')
+        self.assertEqual(200, status)
+        self.assertEqual(b'', body)
+
+    def test_concurrent_requests(self):
+        ''' Context locals are isolated between concurrent tasks. '''
+        @self.app.route('/<n:int>')
+        async def handler(n):
+            await asyncio.sleep(0.01 * (3 - n))
+            return bottle.request.path
+
+        async def run():
+            scopes = [{'type': 'http', 'method': 'GET', 'path': '/%d' % i,
+                       'query_string': b'', 'headers': []} for i in range(3)]
+            return await asyncio.gather(*[self.call(s, [b'']) for s in scopes])
+
+        results = asyncio.run(run())
+        self.assertEqual([b'/0', b'/1', b'/2'], [r[2] for r in results])
+
+    def test_async_route_under_wsgi(self):
+        """ Async callbacks fail with a clear error if served via WSGI. """
+        import warnings
+        import wsgiref.util
+
+        @self.app.route('/coro')
+        async def coro():
+            return 'never'
+
+        @self.app.route('/aiter')
+        def aiter():
+            async def stream():
+                yield 'never'
+            return stream()
+
+        for path in ('/coro', '/aiter'):
+            environ = {'PATH_INFO': path}
+            wsgiref.util.setup_testing_defaults(environ)
+            status = []
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                body = b''.join(self.app.wsgi(
+                    environ, lambda s, h, e=None: status.append(s)))
+            self.assertEqual(['500 Internal Server Error'], status)
+            self.assertIn(b'Bottle.asgi', body)
+        self.app.catchall = False
+        environ = {'PATH_INFO': '/coro'}
+        wsgiref.util.setup_testing_defaults(environ)
+        self.assertRaises(TypeError, self.app.wsgi, environ, lambda *a: None)
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app.asgi({'type': 'lifespan'}, receive, send))
+        self.assertEqual(['lifespan.startup.complete',
+                          'lifespan.shutdown.complete'], sent)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 '''
-Some objects are context-local, meaning that they have different values depending on the context they are accessed from. A context is currently defined as a thread.
+Some objects are context-local, meaning that they have different values depending on the context they are accessed from. A context is defined as a thread or an asyncio task.
 '''
 
+import asyncio
+import contextvars
 import unittest
 import bottle
 import threading
@@ -39,3 +41,38 @@ class TestThreadLocals(unittest.TestCase):
         self.assertEqual(bottle.response.headers['Content-Type'], 'test/main')
         run_thread(run)
         self.assertEqual(bottle.response.headers['Content-Type'], 'test/main')
+
+    def test_unbound(self):
+        def run():
+            self.assertRaises(RuntimeError, getattr, bottle.request, 'environ')
+            self.assertRaises(RuntimeError, getattr, bottle.response, 'body')
+        run_thread(run)
+
+
+class TestTaskLocals(unittest.TestCase):
+    def test_tasks(self):
+        async def handle(path, delay):
+            bottle.request.bind({'PATH_INFO': path})
+            bottle.response.bind()
+            bottle.response.status = delay
+            await asyncio.sleep(delay / 10000.0)
+            return bottle.request.path, bottle.response.status_code
+
+        async def main():
+            return await asyncio.gather(handle('/a', 300), handle('/b', 200))
+
+        self.assertEqual([('/a', 300), ('/b', 200)], asyncio.run(main()))
+
+    def test_copied_context(self):
+        """ Threads running in a copy of the context share the same request
+            and response, e.g. to run blocking code in a thread pool. """
+        bottle.response.bind()
+
+        def run():
+            bottle.response.status = 404
+            bottle.response.set_header('X-Test', 'thread')
+
+        ctx = contextvars.copy_context()
+        run_thread(lambda: ctx.run(run))
+        self.assertEqual(404, bottle.response.status_code)
+        self.assertEqual('thread', bottle.response.get_header('X-Test'))
@@ -10,6 +10,7 @@ import bottle
 from bottle import request, tob, touni, json_dumps, HTTPError, parse_date, CookieError
 from . import tools
 import wsgiref.util
+from io import BytesIO
 import base64
 
 from bottle import BaseRequest, BaseResponse, LocalRequest
@@ -317,6 +318,83 @@ class TestRequest(unittest.TestCase):
     def test_chunked_not_chunked_at_all(self):
         self._test_chunked('abcdef', HTTPError)
 
+    def test_chunked_trailers(self):
+        self._test_chunked('1\r\nx\r\n0\r\n\r\n', 'x')
+        self._test_chunked('1\r\nx\r\n0\r\nA: b\r\nC: d\r\n\r\n', 'x')
+        self._test_chunked('1\r\nx\r\n0\r\nA: b\r\nC: d', HTTPError)
+        self._test_chunked('1\r\nx\r\n0\r\n' + 'A: b\r\n' * 500000, HTTPError)
+
+    def test_chunked_pathological_sizes(self):
+        self._test_chunked('1\r\nx\r\n' * 10000 + '0\r\n', 'x' * 10000)
+        self._test_chunked('0000000000000001\r\nx\r\n0\r\n', 'x')
+        self._test_chunked('A\r\n0123456789\r\na\r\n0123456789\r\n0\r\n',
+                           '0123456789' * 2)
+        self._test_chunked('-1\r\nx\r\n0\r\n', HTTPError)
+        self._test_chunked('\r\nx\r\n0\r\n', HTTPError)
+        self._test_chunked('1\nx\n0\n', HTTPError)
+        self._test_chunked('1\r\nxx\r\n0\r\n', HTTPError)
+        self._test_chunked('1\r\nx', HTTPError)
+        self._test_chunked('1' * 200000 + '\r\n', HTTPError)
+        self._test_chunked('fffffffffffffff\r\nxxx\r\n0\r\n', HTTPError)
+
+    def test_chunked_buffer_boundaries(self):
+        """ Environ: Chunks and CRLFs may cross read() and buffer boundaries. """
+        class ShortReads(BytesIO):
+            def read(self, size=-1):
+                return BytesIO.read(self, min(size, 3))
+
+        sizes = [1, 2, 3, 4, 5, 6, 7, 15, 16, 17, 100]
+        data = b''.join(tob(chr(97 + i % 26)) * n for i, n in enumerate(sizes))
+        body = b''.join(b'%x\r\n%s\r\n' % (n, tob(chr(97 + i % 26)) * n)
+                        for i, n in enumerate(sizes)) + b'0\r\n\r\n'
+        for fp in (BytesIO, ShortReads):
+            for bufsize in (4, 5, 16, 17, 1024):
+                parts = BaseRequest._iter_chunked(fp(body), bufsize)
+                self.assertEqual(data, b''.join(parts))
+
+    def _stream_environ(self, body, chunked=False):
+        e = {}
+        wsgiref.util.setup_testing_defaults(e)
+        e['wsgi.input'].write(tob(body))
+        e['wsgi.input'].seek(0)
+        if chunked:
+            e['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        else:
+            e['CONTENT_LENGTH'] = str(len(body))
+        return e
+
+    def test_stream(self):
+        request = BaseRequest(self._stream_environ('x' * 100))
+        parts = list(request.stream(bufsize=30))
+        self.assertEqual([30, 30, 30, 10], [len(part) for part in parts])
+        self.assertEqual(tob('x' * 100), b''.join(parts))
+        self.assertFalse('bottle.request.body' in request.environ)
+        self.assertRaises(RuntimeError, lambda: request.body)
+        self.assertRaises(RuntimeError, request.stream)
+
+    def test_stream_chunked(self):
+        body = '1\r\nx\r\nff\r\n' + 'y'*255 + '\r\n0\r\n'
+        request = BaseRequest(self._stream_environ(body, chunked=True))
+        self.assertEqual(tob('x' + 'y'*255), b''.join(request.stream()))
+
+    def test_stream_buffered(self):
+        """ Environ: An already buffered body is streamed from the buffer. """
+        request = BaseRequest(self._stream_environ('abc' * 10))
+        self.assertEqual(tob('abc' * 10), request.body.read())
+        self.assertEqual(tob('abc' * 10), b''.join(request.stream(bufsize=7)))
+        self.assertEqual(tob('abc' * 10), request.body.read())
+
+    def test_stream_maxsize(self):
+        request = BaseRequest(self._stream_environ('x' * 100))
+        self.assertRaises(HTTPError, request.stream, maxsize=99)
+        self.assertEqual(100, len(b''.join(request.stream(maxsize=100))))
+        body = '40\r\n' + 'x'*64 + '\r\n40\r\n' + 'x'*64 + '\r\n0\r\n'
+        request = BaseRequest(self._stream_environ(body, chunked=True))
+        self.assertRaises(HTTPError, lambda: list(request.stream(maxsize=100)))
+
+    def test_stream_no_input(self):
+        self.assertEqual([], list(BaseRequest({}).stream()))
+
     def test_multipart(self):
         """ Environ: POST (multipart files and multible values per key) """
         fields = [('field1','value1'), ('field2','value2'), ('field2','万难')]
@@ -400,6 +478,88 @@ class TestRequest(unittest.TestCase):
         e['CONTENT_LENGTH'] = str(len(json_dumps(test)))
         self.assertEqual(BaseRequest(e).json, None)
 
+    def _json_environ(self, body, ctype='application/json'):
+        e = {'CONTENT_TYPE': ctype}
+        wsgiref.util.setup_testing_defaults(e)
+        e['wsgi.input'].write(tob(body))
+        e['wsgi.input'].seek(0)
+        e['CONTENT_LENGTH'] = str(len(tob(body)))
+        return e
+
+    def test_json_max(self):
+        """ Environ: Request.json honors JSON_MAX instead of MEMFILE_MAX. """
+        test = dict(a=1, b='x' * 100)
+        body = json_dumps(test)
+
+        class SmallRequest(BaseRequest):
+            JSON_MAX = 50
+        self.assertRaises(HTTPError, lambda: SmallRequest(self._json_environ(body)).json)
+
+        class BigRequest(BaseRequest):
+            MEMFILE_MAX = 50
+            JSON_MAX = 1000
+        self.assertEqual(test, BigRequest(self._json_environ(body)).json)
+
+    def test_json_decoder(self):
+        """ Environ: Request.json uses a pluggable decoder. """
+        calls = []
+
+        class MyRequest(BaseRequest):
+            def json_decoder(data):
+                calls.append(data)
+                return 'decoded'
+            json_decoder = staticmethod(json_decoder)
+
+        self.assertEqual('decoded', MyRequest(self._json_environ('{"a":1}')).json)
+        self.assertEqual([tob('{"a":1}')], calls)
+
+    def test_json_invalid(self):
+        """ Environ: Request.json with invalid data raises a 400 error. """
+        for body in ('{"a":', '\xff\xfe'):
+            try:
+                BaseRequest(self._json_environ(body)).json
+            except HTTPError as e:
+                self.assertEqual(400, e.status_code)
+            else:
+                self.fail('No HTTPError raised')
+
+    def test_iter_json(self):
+        records = [{'a': 1}, [1, 2, 3], 'x' * 100, None, {'b': {'c': 'ä'}}]
+        body = '\n'.join(json_dumps(r) for r in records) + '\n\n'
+        request = BaseRequest(self._json_environ(body, 'application/x-ndjson'))
+        self.assertEqual(records, list(request.iter_json()))
+
+    def test_iter_json_chunked(self):
+        """ Environ: NDJSON records may span multiple chunks. """
+        body = tob('{"a": 1}\r\n{"b":\n  2}\n[3]')
+        e = self._json_environ('')
+        e['wsgi.input'] = BytesIO(b''.join(b'%x\r\n%s\r\n' % (len(body[i:i+3]), body[i:i+3])
+                                 for i in range(0, len(body), 3)) + b'0\r\n\r\n')
+        e['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        del e['CONTENT_LENGTH']
+        records = BaseRequest(e).iter_json()
+        self.assertEqual({'a': 1}, next(records))
+        self.assertRaises(HTTPError, next, records)
+
+    def test_iter_json_limits(self):
+        class SmallRequest(BaseRequest):
+            JSON_MAX = 10
+        body = '[1]\n' + json_dumps('x' * 10) + '\n[2]'
+        records = SmallRequest(self._json_environ(body)).iter_json()
+        self.assertEqual([1], next(records))
+        self.assertRaises(HTTPError, next, records)
+        records = BaseRequest(self._json_environ(body)).iter_json(maxsize=10)
+        self.assertRaises(HTTPError, next, records)
+        # An unterminated record is limited while it is still buffered.
+        records = SmallRequest(self._json_environ('[1]\n' + 'x' * 20)).iter_json()
+        self.assertEqual([1], next(records))
+        try:
+            next(records)
+        except HTTPError as e:
+            self.assertEqual(413, e.status_code)
+        else:
+            self.fail('No HTTPError raised')
+
     def test_json_header_empty_body(self):
         """Request Content-Type is application/json but body is empty"""
         e = {'CONTENT_TYPE': 'application/json'}
@@ -732,6 +892,19 @@ class TestResponse(unittest.TestCase):
         response['x-test'] = touni('瓶')
         self.assertEqual(touni('瓶'), response['x-test'])
 
+    def test_header_name_cache(self):
+        from bottle import _hkey, _hval
+        self.assertEqual('Content-Type', _hkey('content_type'))
+        self.assertIs(_hkey('content-type'), _hkey('CONTENT-TYPE'))
+        self.assertIs(_hkey('x-custom-header'), _hkey('X-Custom-Header'))
+        self.assertEqual('X-Bytes', _hkey(b'x-bytes'))
+        self.assertEqual('1', _hval('1'))
+        self.assertEqual('True', _hval(True))
+        self.assertEqual('1.0', _hval(1.0))
+        for value in ('te\nst', 'te\rst'):
+            self.assertRaises(ValueError, _hkey, value)
+            self.assertRaises(ValueError, _hval, value)
+
     def test_prevent_control_characters_in_headers(self):
         masks = '{}test', 'test{}', 'te{}st'
         tests = '\n', '\r', '\n\r', '\0'
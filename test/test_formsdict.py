@@ -15,3 +15,51 @@ class TestFormsDict(unittest.TestCase):
         """ FomsDict.attribute returs u'' on missing keys. """
         d = FormsDict()
         self.assertEqual('', d.missing)
+
+    def test_attr_set(self):
+        """ FormsDict instances accept custom attributes. """
+        d = FormsDict(a='1')
+        d.custom = 'value'
+        self.assertEqual('value', d.custom)
+        self.assertEqual('1', d.a)
+
+
+class TestLazyFormsDict(unittest.TestCase):
+    def test_decode_on_access(self):
+        from bottle import _LazyFormsDict
+        d = _LazyFormsDict('a=1&b+c=x+y&a=%e7%93%b6&d&%65=e&b+c=%26')
+        self.assertEqual(['a', 'b c', 'd', 'e'], list(d))
+        self.assertEqual(set(d), d._raw)
+        self.assertEqual('x y', d.get('b c', index=0))
+        self.assertEqual({'a', 'd', 'e'}, d._raw)
+        self.assertEqual(['1', '瓶'], d.getall('a'))
+        self.assertEqual('', d.d)
+        self.assertEqual('e', d['e'])
+        self.assertEqual('&', d['b c'])
+        self.assertEqual(set(), d._raw)
+
+    def test_modify(self):
+        from bottle import _LazyFormsDict
+        d = _LazyFormsDict('a=%20&b=%20&c=%20&d=%20')
+        d['a'] = '%20'
+        d.replace('b', '%20')
+        del d['c']
+        self.assertEqual([('a', ' '), ('a', '%20'), ('b', '%20'), ('d', ' ')],
+                         list(d.allitems()))
+        self.assertEqual([' ', '%20'], d.decode().getall('a'))
+
+    def test_copy_and_pickle(self):
+        import copy, pickle
+        from bottle import _LazyFormsDict
+        d = _LazyFormsDict('a=%20&b=x+y')
+        self.assertEqual(' ', d['a'])
+        for clone in (copy.copy, copy.deepcopy,
+                      lambda d: pickle.loads(pickle.dumps(d))):
+            c = clone(d)
+            self.assertEqual(' ', c.a)
+            self.assertEqual('x y', c['b'])
+            self.assertEqual('', c.missing)
+
+    def test_unhashable_key(self):
+        from bottle import _LazyFormsDict
+        self.assertEqual('d', _LazyFormsDict('a=1').get([], 'd'))
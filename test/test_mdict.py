@@ -29,6 +29,25 @@ class TestMultiDict(unittest.TestCase):
         self.assertEqual([], m.getall('b'))
         self.assertEqual([('a', 5), ('a', 6)], list(m.iterallitems()))
    
+    def test_get(self):
+        """ MultiDict.get() supports index, type and default """
+        m = MultiDict(a='5')
+        m['a'] = 'x'
+        self.assertEqual('5', m.get('a', index=0))
+        self.assertEqual(5, m.get('a', index=0, type=int))
+        self.assertEqual('d', m.get('a', 'd', type=int))
+        self.assertEqual('d', m.get('a', 'd', index=2))
+        self.assertEqual('d', m.get('b', 'd'))
+        m.dict['c'] = []
+        self.assertEqual('d', m.get('c', 'd'))
+        self.assertEqual('d', m.get({}, 'd'))
+
+    def test_pickle(self):
+        import pickle
+        m = MultiDict(a=5)
+        m['a'] = 6
+        self.assertEqual([5, 6], pickle.loads(pickle.dumps(m)).getall('a'))
+
     def test_isheader(self):
         """ HeaderDict replaces by default and title()s its keys """
         m = HeaderDict(abc_def=5)
@@ -74,6 +74,15 @@ class TestRouter(unittest.TestCase):
         self.assertRaises(bottle.HTTPError, self.match, '/object/')
         self.assertRaises(bottle.HTTPError, self.match, '/object/.')
 
+    def testUUIDFilter(self):
+        from uuid import UUID
+        uid = '12345678-1234-5678-9ABC-def012345678'
+        self.assertMatches('/object/<id:uuid>', '/object/' + uid, id=UUID(uid))
+        self.assertRaises(bottle.HTTPError, self.match, '/object/12345678')
+        self.assertRaises(bottle.HTTPError, self.match, '/object/%sa' % uid)
+        self.add('/uuid/<id:uuid>', 'handler', name='uuidroute')
+        self.assertEqual('/uuid/' + uid.lower(), self.r.build('uuidroute', id=UUID(uid)))
+
     def testPathFilter(self):
         self.assertMatches('/<id:path>/:f', '/a/b', id='a', f='b')
         self.assertMatches('/<id:path>', '/a', id='a')
@@ -82,6 +91,12 @@ class TestRouter(unittest.TestCase):
         self.assertMatches('/anon/<>', '/anon/whatever')
         self.assertMatches('/anonfilter/<:int>', '/anonfilter/5')
         self.assertRaises(bottle.HTTPError, self.match, '/anonfilter/noint')
+        self.assertMatches('/anonfloat/<:float>/<name>', '/anonfloat/1.5/x', name='x')
+        self.assertRaises(bottle.HTTPError, self.match, '/anonfloat/1.2.3/x')
+
+    def testManyWildcards(self):
+        self.assertMatches('/<a>/<b:int>/x-<c>/<d:float>/<e:path>', '/a/1/x-c/2.5/e/f',
+                           a='a', b=1, c='c', d=2.5, e='e/f')
 
     def testWildcardNames(self):
         self.assertMatches('/alpha/:abc', '/alpha/alpha', abc='alpha')
@@ -133,6 +148,19 @@ class TestRouter(unittest.TestCase):
         # RouteBuildError: Missing URL argument: anon0.
         self.assertRaises(ValueError, build, 'introute', 'hello')
 
+    def testBuildMany(self):
+        add, build_many = self.add, self.r.build_many
+        add('/<a>/%/<b:int>', 'handler', name='named')
+        add('/anon/<:int>', 'handler', name='anon')
+        params = [{'a': 'x', 'b': 1}, {'a': 'y', 'b': '2', 'q': 'v'}]
+        self.assertEqual(['/x/%/1', '/y/%/2?q=v'], build_many('named', params))
+        self.assertEqual([{'a': 'x', 'b': 1}, {'a': 'y', 'b': '2', 'q': 'v'}],
+                         params)  # Input is not modified
+        self.assertEqual(['/anon/1', '/anon/2'], build_many('anon', [(1,), (2,)]))
+        self.assertEqual([], build_many('named', []))
+        self.assertRaises(bottle.RouteBuildError, build_many, 'named', [{'a': 1}])
+        self.assertRaises(bottle.RouteBuildError, build_many, 'missing', [])
+
     def test_dynamic_before_static_any(self):
         ''' Static ANY routes have lower priority than dynamic GET routes. '''
         self.add('/foo', 'foo', 'ANY')
@@ -161,6 +189,229 @@ class TestRouter(unittest.TestCase):
             self.add('/<:>/'+str(i), str(i), 'GET')
         self.assertEqual(self.match('/foo/'+str(n-1))[0], str(n-1))
 
+    def assertAllow(self, allow, path, method='GET'):
+        try:
+            self.match(path, method)
+        except bottle.HTTPError as e:
+            self.assertEqual(405, e.status_code)
+            self.assertEqual(allow, e.get_header('Allow'))
+        else:
+            self.fail('No 405 raised')
+
+    def test_method_not_allowed_index(self):
+        self.add('/static', 'a', 'POST')
+        self.add('/static', 'b', 'PUT')
+        self.add('/<x>', 'c', 'DELETE')
+        self.add('/<x:int>', 'd', 'PATCH')
+        self.add('/<p:path>/edit', 'e', 'POST')
+        self.add('/<x>', 'f', 'GET')
+        self.assertAllow('DELETE,GET,POST,PUT', '/static', 'OPTIONS')
+        self.assertAllow('DELETE,GET,PATCH', '/5', 'PUT')
+        self.assertAllow('POST', '/a/b/edit')
+        self.assertRaises(bottle.HTTPError, self.match, '/a/b')
+        self.assertAllow('DELETE,GET', '/x', 'PUT')
+        # Routes added later are included as well
+        self.add('/<x>', 'g', 'PUT')
+        self.assertAllow('DELETE,GET,PUT', '/x', 'POST')
+
+    def test_deferred_compile(self):
+        self.add('/<a>', 'a')
+        self.add('/<a>/<b>', 'b')
+        self.assertFalse(self.r.dyna_regexes or self.r.dyna_tries)
+        self.assertIs(self.r, self.r.freeze())
+        compiled = (self.r.dyna_regexes, self.r.dyna_tries)
+        self.assertEqual(self.match('/x')[0], 'a')
+        self.assertIs(compiled[0], self.r.dyna_regexes)
+        self.assertIs(compiled[1], self.r.dyna_tries)
+        self.add('/<a>/<b>/<c>', 'c')
+        self.assertEqual(self.match('/x/y/z')[0], 'c')
+        self.assertIsNot(compiled[0], self.r.dyna_regexes)
+
+    def test_replace_after_freeze(self):
+        self.add('/<a>', 'old')
+        self.assertEqual(self.match('/x')[0], 'old')
+        self.add('/<b>', 'new')
+        self.assertEqual(self.match('/x'), ('new', {'b': 'x'}))
+
+    def test_profile(self):
+        self.assertEqual(None, self.r.stats())
+        self.add('/static', 'static')
+        self.add('/<a>/<b>', 'dynamic')
+        self.add('/<a>/<b>', 'post', 'POST')
+        self.r.profile = True
+        self.match('/static')
+        self.match('/x/y')
+        self.match('/x/z')
+        self.assertRaises(bottle.HTTPError, self.match, '/x')
+        self.assertRaises(bottle.HTTPError, self.match, '/x/y', 'PUT')
+        stats = self.r.stats()
+        self.assertEqual(5, stats['matches'])
+        self.assertEqual({'static': 1, 'dynamic': 2}, stats['hits'])
+        self.assertEqual({404: 1, 405: 1}, stats['errors'])
+        self.assertTrue(stats['time'] > 0)
+        if self.r.mode == 'regex':
+            self.assertEqual(3, stats['chunks'])
+        self.r.profile = False
+        self.assertEqual(None, self.r.stats())
+
+    def test_report(self):
+        self.add('/<a>/<b>', 'wild')
+        self.add('/x/<b:int>', 'shadowed')
+        self.add('/x/<b:re:[a-z]*>', 'not shadowed (empty segment)')
+        self.add('/<a>/<b>', 'post', 'POST')
+        self.add('/x/<b:int>', 'post', 'POST')
+        self.add('/<p:path>', 'path')
+        self.add('/a/b/c', 'static')
+        self.r.strict_order = True
+        self.add('/a/b/c/d', 'shadowed static')
+        report = self.r.report()
+        self.assertEqual([('GET', '/x/<b:int>', '/<a>/<b>'),
+                          ('GET', '/a/b/c/d', '/<p:path>'),
+                          ('POST', '/x/<b:int>', '/<a>/<b>')],
+                         sorted(report['shadowed'], key=lambda x: x[0]))
+        self.assertEqual([('GET', '/<p:path>')], report['fallback'])
+
 class TestRouterInCGIMode(TestRouter):
     ''' Makes no sense since the default route does not optimize CGI anymore.'''
     CGI = True
+
+
+class TestTrieRouter(TestRouter):
+    ''' Run all router tests against the trie-based matcher. '''
+
+    def setUp(self):
+        self.r = bottle.Router(mode='trie')
+
+    def test_first_match_wins(self):
+        self.add('/<a>/<b>', 'wild')
+        self.add('/foo/<b>', 'prefix')
+        self.add('/<a>/bar', 'suffix')
+        self.assertEqual(self.match('/foo/bar')[0], 'wild')
+        self.assertEqual(self.match('/x/y'), ('wild', {'a': 'x', 'b': 'y'}))
+
+    def test_literal_before_wildcard(self):
+        self.add('/foo/<b>', 'prefix')
+        self.add('/<a>/bar', 'suffix')
+        self.add('/<a>/<b:int>', 'int')
+        self.assertEqual(self.match('/foo/bar')[0], 'prefix')
+        self.assertEqual(self.match('/x/bar')[0], 'suffix')
+        self.assertEqual(self.match('/x/5'), ('int', {'a': 'x', 'b': 5}))
+
+    def test_mixed_segments(self):
+        self.add('/file-<name>.txt', 'txt')
+        self.add('/file-<name>', 'any')
+        self.assertEqual(self.match('/file-a.txt'), ('txt', {'name': 'a'}))
+        self.assertEqual(self.match('/file-a.jpg'), ('any', {'name': 'a.jpg'}))
+
+    def test_segment_args(self):
+        ''' Rules with one wildcard per segment do not need a regex match. '''
+        self.add('/<a>/<b:int>/', 'split')
+        self.add('/x-<a>/<b:int>', 'regex')
+        self.assertIn('/<a>/<b:int>/', self.r._segment_getargs)
+        self.assertNotIn('/x-<a>/<b:int>', self.r._segment_getargs)
+        self.assertEqual(self.match('/a/-5/'), ('split', {'a': 'a', 'b': -5}))
+        self.assertEqual(self.match('/x-a/5'), ('regex', {'a': 'a', 'b': 5}))
+
+    def test_fallback_order(self):
+        ''' Rules that cannot be split into segments keep their priority. '''
+        self.add('/a/<x>', 'segment')
+        self.add('/<p:path>', 'path')
+        self.add('/b/<x>', 'late')
+        self.assertEqual(self.match('/a/b')[0], 'segment')
+        self.assertEqual(self.match('/b/c')[0], 'path')
+        self.assertEqual(self.match('/c/d/e'), ('path', {'p': 'c/d/e'}))
+
+    def test_method_not_allowed(self):
+        self.add('/foo/<x>', 'post', 'POST')
+        self.add('/foo/<x:int>', 'put', 'PUT')
+        try:
+            self.match('/foo/5', 'GET')
+        except bottle.HTTPError as e:
+            self.assertEqual(405, e.status_code)
+            self.assertEqual('POST,PUT', e.get_header('Allow'))
+        else:
+            self.fail('No 405 raised')
+
+    def test_switch_mode(self):
+        self.add('/<a>/<b>', 'wild')
+        self.r.mode = 'regex'
+        self.assertEqual(self.match('/foo/bar')[0], 'wild')
+        self.assertFalse(self.r.dyna_tries)
+        self.r.mode = 'trie'
+        self.assertEqual(self.match('/foo/bar')[0], 'wild')
+        self.assertFalse(self.r.dyna_regexes)
+
+    def test_unknown_mode(self):
+        self.assertRaises(bottle.RouterUnknownModeError,
+                          setattr, self.r, 'mode', 'magic')
+
+
+class TestCachedRouter(TestRouter):
+    ''' Run all router tests with the match cache enabled. '''
+
+    def setUp(self):
+        self.r = bottle.Router(cache_size=3)
+
+    def test_cache_hits(self):
+        self.add('/<a>/<b:int>', 'target')
+        self.assertEqual(self.match('/x/1'), ('target', {'a': 'x', 'b': 1}))
+        args = self.match('/x/1')[1]
+        self.assertEqual({'a': 'x', 'b': 1}, args)
+        args['a'] = 'changed'  # Must not affect the cache
+        self.assertEqual(self.match('/x/1'), ('target', {'a': 'x', 'b': 1}))
+        self.assertRaises(bottle.HTTPError, self.match, '/x/1', 'POST')
+        info = self.r.cache_info()
+        self.assertEqual((2, 2, 1, 3), (info['hits'], info['misses'],
+                                        info['size'], info['maxsize']))
+
+    def test_cache_eviction(self):
+        self.add('/<a>', 'target')
+        for path in ('/a', '/b', '/c', '/a', '/d'):
+            self.match(path)
+        self.assertEqual([('GET', '/c'), ('GET', '/a'), ('GET', '/d')],
+                         list(self.r._cache))
+
+    def test_cache_cleared_on_change(self):
+        self.add('/<a>', 'old')
+        self.assertEqual(self.match('/x')[0], 'old')
+        self.add('/x', 'new')
+        self.assertEqual(self.match('/x')[0], 'new')
+
+    def test_mutable_args_not_cached(self):
+        self.r.add_filter('list', lambda conf: (r'[\d,]+', lambda x: x.split(','), None))
+        self.add('/<ids:list>', 'target')
+        self.assertEqual(self.match('/1,2')[1], {'ids': ['1', '2']})
+        self.assertEqual(0, self.r.cache_info()['size'])
+
+    def test_disable_cache(self):
+        self.add('/<a>', 'target')
+        self.match('/x')
+        self.r.cache_size = 0
+        self.assertEqual(self.match('/x')[0], 'target')
+        self.assertEqual({'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 0},
+                         self.r.cache_info())
+
+
+class TestSegmentSafe(unittest.TestCase):
+
+    def test_builtin_filters(self):
+        router = bottle.Router()
+        for name in ('int', 'float', 'uuid'):
+            mask = router.filters[name](None)[0]
+            self.assertTrue(bottle._re_segment_safe(mask))
+        self.assertTrue(bottle._re_segment_safe(router.default_pattern))
+        self.assertFalse(bottle._re_segment_safe(router.filters['path'](None)[0]))
+
+    def test_custom_patterns(self):
+        for p in ('[a-z]+', r'\d{4}', '(?:foo|bar)', '[^/]*'):
+            self.assertTrue(bottle._re_segment_safe(p), p)
+        for p in ('.*', '[^a]+', 'a/b', r'\S+', '(?=x)', 'a$', r'\.',
+                  '[!-0]+', '[+-0]', r'[\x2f]', '[a/]', r'[\W]'):
+            self.assertFalse(bottle._re_segment_safe(p), p)
+
+    def test_range_across_slash(self):
+        for mode in ('regex', 'trie'):
+            router = bottle.Router(mode=mode)
+            router.add('/<x:re:[!-0]+>/end', 'GET', 'target')
+            self.assertEqual({'x': '+/-'},
+                             router.match({'PATH_INFO': '/+/-/end', 'REQUEST_METHOD': 'GET'})[1])
@@ -4,8 +4,13 @@ from bottle import static_file, request, response, parse_date, parse_range_heade
 import bottle
 import wsgiref.util
 import os
+import shutil
+import socket
 import tempfile
+import threading
 import time
+from io import BytesIO
+from urllib.request import Request, urlopen
 
 basename = os.path.basename(__file__)
 root = os.path.dirname(__file__)
@@ -147,7 +152,7 @@ class TestSendFile(unittest.TestCase):
         self.assertEqual(open(__file__,'rb').read(), f.body.read())
 
     def test_range(self):
-        request.environ['HTTP_RANGE'] = 'bytes=10-25,-80'
+        request.environ['HTTP_RANGE'] = 'bytes=10-25'
         f = static_file(basename, root=root)
         c = open(__file__, 'rb'); c.seek(10)
         self.assertEqual(c.read(16), tob('').join(f.body))
@@ -155,6 +160,48 @@ class TestSendFile(unittest.TestCase):
                          f.headers['Content-Range'])
         self.assertEqual('bytes', f.headers['Accept-Ranges'])
 
+    def test_multirange(self):
+        request.environ['HTTP_RANGE'] = 'bytes=10-25,-80'
+        f = static_file(basename, root=root)
+        data = open(__file__, 'rb').read()
+        size = len(data)
+        self.assertEqual(206, f.status_code)
+        ctype, boundary = f.headers['Content-Type'].split('; boundary=')
+        self.assertEqual('multipart/byteranges', ctype)
+        body = tob('').join(f.body)
+        f.body.close()
+        self.assertEqual(str(len(body)), f.headers['Content-Length'])
+        expected = tob(
+            '--%s\r\nContent-Type: text/x-python; charset=UTF-8\r\n'
+            'Content-Range: bytes 10-25/%d\r\n\r\n' % (boundary, size)) + data[10:26]
+        expected += tob(
+            '\r\n--%s\r\nContent-Type: text/x-python; charset=UTF-8\r\n'
+            'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                boundary, size - 80, size - 1, size)) + data[-80:]
+        expected += tob('\r\n--%s--\r\n' % boundary)
+        self.assertEqual(expected, body)
+
+    def test_multirange_coalesce(self):
+        request.environ['HTTP_RANGE'] = 'bytes=50-60,0-10,5-20,40-45'
+        f = static_file(basename, root=root)
+        self.assertEqual('bytes 0-60/%d' % os.path.getsize(__file__),
+                         f.headers['Content-Range'])
+        self.assertEqual(open(__file__, 'rb').read()[:61], tob('').join(f.body))
+        f.body.close()
+        self.assertEqual([(0, 20), (500, 600)],
+                         bottle._coalesce_ranges([(500, 600), (0, 10), (10, 20)]))
+
+    def test_multirange_limit(self):
+        request.environ['HTTP_RANGE'] = 'bytes=0-0,1000-1000,2000-2000'
+        f = static_file(basename, root=root, max_ranges=2)
+        self.assertEqual(200, f.status_code)
+        self.assertEqual(open(__file__, 'rb').read(), f.body.read())
+        f.body.close()
+        f = static_file(basename, root=root, max_ranges=3)
+        self.assertEqual(206, f.status_code)
+        self.assertEqual(3, tob('').join(f.body).count(tob('Content-Range')))
+        f.body.close()
+
     def test_range_parser(self):
         r = lambda rs: list(parse_range_header(rs, 100))
         self.assertEqual([(90, 100)], r('bytes=-10'))
@@ -171,3 +218,357 @@ class TestSendFile(unittest.TestCase):
         self.assertEqual('test-value', res.headers['X-Custom-Header'])
         # Check the passed in headers dict isn't modified.
         self.assertEqual(headers_orig, headers)
+
+
+class TestFileWrapper(unittest.TestCase):
+    def setUp(self):
+        self.data = open(__file__, 'rb').read()
+
+    def recv(self, wrapper):
+        a, b = socket.socketpair()
+        with a, b:
+            sent = wrapper.sendfile(a)
+            a.close()
+            return sent, b''.join(iter(lambda: b.recv(4096), b''))
+
+    def test_iter(self):
+        w = bottle.WSGIFileWrapper(open(__file__, 'rb'), 7)
+        self.assertEqual(self.data, b''.join(w))
+        w = bottle.WSGIFileWrapper(open(__file__, 'rb'), 7, 10, 100)
+        self.assertEqual(self.data[10:110], b''.join(w))
+        w = bottle.WSGIFileWrapper(open(__file__, 'rb'), 7, 10, 10**9)
+        self.assertEqual(self.data[10:], b''.join(w))
+
+    def test_sendfile(self):
+        with open(__file__, 'rb') as fp:
+            self.assertEqual((len(self.data), self.data),
+                             self.recv(bottle.WSGIFileWrapper(fp)))
+        with open(__file__, 'rb') as fp:
+            fp.read(5)
+            self.assertEqual((len(self.data) - 5, self.data[5:]),
+                             self.recv(bottle.WSGIFileWrapper(fp)))
+        with open(__file__, 'rb') as fp:
+            self.assertEqual((100, self.data[10:110]),
+                             self.recv(bottle.WSGIFileWrapper(fp, 7, 10, 100)))
+
+    def test_sendfile_unsupported(self):
+        w = bottle.WSGIFileWrapper(BytesIO(self.data))
+        self.assertEqual((None, b''), self.recv(w))
+
+    def test_range_body(self):
+        e = dict()
+        wsgiref.util.setup_testing_defaults(e)
+        e['HTTP_RANGE'] = 'bytes=10-25'
+        request.bind(e)
+        f = static_file(basename, root=root)
+        self.assertTrue(isinstance(f.body, bottle.WSGIFileWrapper))
+        self.assertEqual((10, 16), (f.body.offset, f.body.length))
+        f.body.close()
+
+    def test_wsgiref(self):
+        sent = []
+        sendfile = bottle.WSGIFileWrapper.sendfile
+        def spy(wrapper, sock):
+            sent.append(wrapper.length)
+            return sendfile(wrapper, sock)
+        bottle.WSGIFileWrapper.sendfile = spy
+        self.addCleanup(setattr, bottle.WSGIFileWrapper, 'sendfile', sendfile)
+        app = Bottle()
+        app.route('/<name>', callback=lambda name: static_file(name, root=root))
+        server = bottle.WSGIRefServer(host='127.0.0.1', port=0)
+        server.quiet = True
+        thread = threading.Thread(target=server.run, args=(app,), daemon=True)
+        thread.start()
+        while not hasattr(server, 'srv'):
+            time.sleep(0.01)
+        try:
+            url = 'http://127.0.0.1:%d/%s' % (server.port, basename)
+            with urlopen(url) as r:
+                self.assertEqual(self.data, r.read())
+            with urlopen(Request(url, headers={'Range': 'bytes=10-25'})) as r:
+                self.assertEqual(206, r.status)
+                self.assertEqual(self.data[10:26], r.read())
+            self.assertEqual([None, 16], sent)
+            with urlopen(Request(url, headers={'Range': 'bytes=0-9,-10'})) as r:
+                body = r.read()
+                self.assertEqual(206, r.status)
+                self.assertEqual(int(r.headers['Content-Length']), len(body))
+                self.assertTrue(body.endswith(self.data[-10:] + b'\r\n--' +
+                    tob(r.headers['Content-Type'].split('=')[1]) + b'--\r\n'))
+        finally:
+            server.srv.shutdown()
+            server.srv.server_close()
+            thread.join()
+
+
+class TestStaticCache(unittest.TestCase):
+    def setUp(self):
+        e = dict()
+        wsgiref.util.setup_testing_defaults(e)
+        request.bind(e)
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'a.css')
+        self.write(b'a {}')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, data, mtime=1000000000):
+        with open(self.path, 'wb') as fp:
+            fp.write(data)
+        os.utime(self.path, (mtime, mtime))
+
+    def get(self, cache, **args):
+        res = static_file('a.css', root=self.root, cache=cache, **args)
+        if hasattr(res.body, 'read'):
+            res.body = res.body.read()
+            res.headers.pop('Date')
+        return res
+
+    def test_hit(self):
+        cache = bottle.StaticCache()
+        a, b = self.get(cache), self.get(cache)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(b'a {}', b.body)
+        self.assertEqual(dict(a.headers), dict(b.headers))
+        self.assertEqual(dict(a.headers), dict(self.get(None).headers))
+        self.assertEqual('text/css; charset=UTF-8', b.headers['Content-Type'])
+
+    def test_arguments(self):
+        cache = bottle.StaticCache()
+        self.get(cache)
+        res = self.get(cache, mimetype='text/plain', etag=False,
+                       headers={'X-Test': '1', 'Content-Length': '0'})
+        self.assertEqual('text/plain; charset=UTF-8', res.headers['Content-Type'])
+        self.assertEqual('4', res.headers['Content-Length'])
+        self.assertEqual('1', res.headers['X-Test'])
+        self.assertTrue('ETag' not in res.headers)
+        self.assertEqual(1, cache.misses)
+
+    def test_conditional(self):
+        cache = bottle.StaticCache()
+        etag = self.get(cache).headers['ETag']
+        request.environ['HTTP_IF_NONE_MATCH'] = etag
+        self.assertEqual(304, self.get(cache).status_code)
+        del request.environ['HTTP_IF_NONE_MATCH']
+        request.environ['HTTP_IF_MODIFIED_SINCE'] = bottle.http_date(1000000000)
+        self.assertEqual(304, self.get(cache).status_code)
+
+    def test_mtime(self):
+        cache = bottle.StaticCache()
+        etag = self.get(cache).headers['ETag']
+        self.write(b'a { }', 1000000001)
+        res = self.get(cache)
+        self.assertEqual(b'a { }', res.body)
+        self.assertEqual('5', res.headers['Content-Length'])
+        self.assertNotEqual(etag, res.headers['ETag'])
+        os.unlink(self.path)
+        self.assertEqual(404, self.get(cache).status_code)
+        self.assertEqual(0, len(cache._entries))
+
+    def test_ttl(self):
+        cache = bottle.StaticCache(revalidate='ttl', ttl=3600)
+        self.get(cache)
+        self.write(b'a { }', 1000000001)
+        self.assertEqual('4', self.get(cache).headers['Content-Length'])
+        cache.ttl = 0
+        self.assertEqual('5', self.get(cache).headers['Content-Length'])
+
+    def test_inotify(self):
+        cache = bottle.StaticCache(revalidate='inotify')
+        self.addCleanup(cache.close)
+        if cache.revalidate != 'inotify':
+            return  # Not available on this platform
+        self.get(cache)
+        self.assertTrue(cache._entries[self.path].wd is not None)
+        self.write(b'a { }', 1000000001)
+        for i in range(100):
+            if self.path not in cache._entries:
+                break
+            time.sleep(0.01)
+        self.assertEqual('5', self.get(cache).headers['Content-Length'])
+
+    def test_maxsize(self):
+        cache = bottle.StaticCache(maxsize=2)
+        for name in 'bcd':
+            with open(os.path.join(self.root, name), 'wb') as fp:
+                fp.write(b'x')
+            static_file(name, root=self.root, cache=cache).body.close()
+        self.assertEqual(['c', 'd'], [os.path.basename(p) for p in cache._entries])
+
+    def test_errors(self):
+        cache = bottle.StaticCache()
+        self.assertEqual(404, static_file('x', root=self.root, cache=cache).status_code)
+        self.assertEqual(403, static_file('../x', root=self.root, cache=cache).status_code)
+        self.assertEqual(0, len(cache._entries))
+        self.assertRaises(ValueError, bottle.StaticCache, revalidate='never')
+
+    def test_content(self):
+        cache = bottle.StaticCache(max_bytes=100)
+        self.assertEqual(b'a {}', self.get(cache).body)
+        res = self.get(cache)
+        self.assertEqual(b'a {}', res.body)
+        self.assertEqual('4', res.headers['Content-Length'])
+        self.assertEqual(4, cache.cached_bytes)
+        request.environ['HTTP_RANGE'] = 'bytes=1-2'
+        res = self.get(cache)
+        self.assertEqual(206, res.status_code)
+        self.assertEqual(b' {', res.body)
+        self.assertEqual('bytes 1-2/4', res.headers['Content-Range'])
+        request.environ['HTTP_IF_NONE_MATCH'] = res.headers['ETag']
+        self.assertEqual(304, self.get(cache).status_code)
+        del request.environ['HTTP_IF_NONE_MATCH']
+        del request.environ['HTTP_RANGE']
+        request.environ['REQUEST_METHOD'] = 'HEAD'
+        self.assertEqual('', self.get(cache).body)
+
+    def test_content_multirange(self):
+        cache = bottle.StaticCache(max_bytes=1000)
+        self.write(b'a' * 100 + b'b' * 100 + b'c' * 100)
+        self.get(cache)
+        request.environ['HTTP_RANGE'] = 'bytes=0-0,-1'
+        res = self.get(cache)
+        body = b''.join(res.body)
+        self.assertEqual(str(len(body)), res.headers['Content-Length'])
+        self.assertTrue(b'\r\n\r\na\r\n--' in body)
+        self.assertTrue(b'\r\n\r\nc\r\n--' in body)
+        self.assertEqual(2, body.count(b'Content-Range'))
+
+    def test_content_changed(self):
+        cache = bottle.StaticCache(max_bytes=100)
+        self.get(cache)
+        self.write(b'a { }', 1000000001)
+        self.assertEqual(b'a { }', self.get(cache).body)
+        self.assertEqual(5, cache.cached_bytes)
+        cache.clear()
+        self.assertEqual(0, cache.cached_bytes)
+
+    def test_content_limits(self):
+        cache = bottle.StaticCache(max_bytes=10, max_file_size=4)
+        for name, size in (('b', 4), ('c', 5), ('d', 4), ('e', 4)):
+            with open(os.path.join(self.root, name), 'wb') as fp:
+                fp.write(b'x' * size)
+            res = static_file(name, root=self.root, cache=cache)
+            self.assertEqual(size <= 4, isinstance(res.body, bytes))
+            if not isinstance(res.body, bytes):
+                res.body.close()
+        self.assertEqual(8, cache.cached_bytes)
+        self.assertEqual(['d', 'e'], [os.path.basename(p) for p in cache._data])
+        self.assertEqual(4, len(cache._entries))
+
+
+class TestCompressedVariants(unittest.TestCase):
+    def setUp(self):
+        e = dict()
+        wsgiref.util.setup_testing_defaults(e)
+        request.bind(e)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.data = b'var x = 1;\n' * 100
+        self.write('app.js', self.data, 1000000000)
+
+    def write(self, name, data, mtime=1000000000):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        os.utime(path, (mtime, mtime))
+
+    def get(self, accept=None, **args):
+        if accept is None:
+            request.environ.pop('HTTP_ACCEPT_ENCODING', None)
+        else:
+            request.environ['HTTP_ACCEPT_ENCODING'] = accept
+        res = static_file('app.js', root=self.root, **args)
+        if hasattr(res.body, 'read'):
+            body = res.body
+            res.body = b''.join(body)
+            body.close()
+        return res
+
+    def test_accepted_encodings(self):
+        parse = bottle._accepted_encodings
+        self.assertEqual(('br', 'gzip'), parse('gzip, deflate, br'))
+        self.assertEqual(('gzip',), parse('gzip;q=0.5, br;q=0'))
+        self.assertEqual(('gzip',), parse('x-gzip'))
+        self.assertEqual(('br', 'gzip'), parse('*'))
+        self.assertEqual(('br',), parse('*, gzip;q=0'))
+        self.assertEqual((), parse('identity'))
+        self.assertEqual((), parse(''))
+
+    def test_precompressed(self):
+        self.write('app.js.gz', b'gz', 1000000001)
+        self.write('app.js.br', b'brotli', 1000000000)
+        plain = self.get(precompressed=True)
+        self.assertEqual(self.data, plain.body)
+        self.assertEqual('Accept-Encoding', plain.headers['Vary'])
+        self.assertTrue('Content-Encoding' not in plain.headers)
+
+        res = self.get('gzip, br', precompressed=True)
+        self.assertEqual(b'brotli', res.body)
+        self.assertEqual('br', res.headers['Content-Encoding'])
+        self.assertEqual('6', res.headers['Content-Length'])
+        self.assertEqual('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(plain.headers['Content-Type'], res.headers['Content-Type'])
+        self.assertEqual(plain.headers['Last-Modified'], res.headers['Last-Modified'])
+        self.assertNotEqual(plain.headers['ETag'], res.headers['ETag'])
+
+        res = self.get('gzip', precompressed=True)
+        self.assertEqual(b'gz', res.body)
+        self.assertEqual('gzip', res.headers['Content-Encoding'])
+
+        request.environ['HTTP_IF_NONE_MATCH'] = res.headers['ETag']
+        self.assertEqual(304, self.get('gzip', precompressed=True).status_code)
+        self.assertEqual(200, self.get('br', precompressed=True).status_code)
+
+    def test_precompressed_outdated(self):
+        self.write('app.js.gz', b'gz', 999999999)
+        res = self.get('gzip', precompressed=True)
+        self.assertEqual(self.data, res.body)
+        self.assertEqual('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(self.data, self.get('gzip').body)
+
+    def test_precompressed_cache(self):
+        self.write('app.js.gz', b'gz', 1000000001)
+        cache = bottle.StaticCache(max_bytes=10000)
+        for i in range(2):
+            self.assertEqual(b'gz', self.get('gzip', cache=cache, precompressed=True).body)
+        self.assertEqual(2, cache.hits)
+
+    def test_range(self):
+        self.write('app.js.gz', b'0123456789', 1000000001)
+        request.environ['HTTP_RANGE'] = 'bytes=2-4'
+        res = self.get('gzip', precompressed=True)
+        self.assertEqual(b'234', res.body)
+        self.assertEqual('bytes 2-4/10', res.headers['Content-Range'])
+
+    def test_vary(self):
+        res = self.get(precompressed=True, headers={'Vary': 'Cookie'})
+        self.assertEqual('Cookie, Accept-Encoding', res.headers['Vary'])
+        res = self.get(headers={'Vary': 'Cookie'})
+        self.assertEqual('Cookie', res.headers['Vary'])
+
+    def test_compress(self):
+        import gzip
+        cache = bottle.StaticCache(max_bytes=10000, compress=True)
+        plain = self.get(cache=cache)
+        self.assertEqual(self.data, plain.body)
+        self.assertEqual('Accept-Encoding', plain.headers['Vary'])
+        res = self.get('gzip', cache=cache)
+        self.assertEqual('gzip', res.headers['Content-Encoding'])
+        self.assertEqual(self.data, gzip.decompress(res.body))
+        self.assertEqual(str(len(res.body)), res.headers['Content-Length'])
+        self.assertEqual(plain.headers['ETag'] + '-gzip', res.headers['ETag'])
+        self.assertEqual(len(self.data) + len(res.body), cache.cached_bytes)
+        self.assertEqual(res.body, self.get('gzip', cache=cache).body)
+        cache.clear()
+        self.assertEqual(0, cache.cached_bytes)
+
+    def test_compress_skipped(self):
+        cache = bottle.StaticCache(max_bytes=10000, compress=True)
+        res = self.get('gzip', cache=cache, mimetype='image/png')
+        self.assertEqual(self.data, res.body)
+        self.assertTrue('Vary' not in res.headers)
+        self.write('app.js', os.urandom(500), 1000000001)
+        res = self.get('gzip', cache=cache)
+        self.assertTrue('Content-Encoding' not in res.headers)
+        self.assertEqual(500, len(res.body))
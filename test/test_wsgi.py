@@ -171,6 +171,159 @@ class TestWsgi(ServerTestBase):
         self.assertTrue('c=c; Path=/' in c)
 
 
+class TestStaticHeaders(ServerTestBase):
+    def setUp(self):
+        ServerTestBase.setUp(self)
+        self.app.config['response.headers.x_frame_options'] = 'DENY'
+        self.app.config['response.headers.X-Static'] = 'äöü'
+
+        @self.app.route('/')
+        def index():
+            return 'hello'
+
+        @self.app.route('/override')
+        def override():
+            bottle.response.set_header('X-Frame-Options', 'SAMEORIGIN')
+            bottle.response.set_header('Content-Type', 'text/plain')
+            return 'hello'
+
+        @self.app.route('/notmodified')
+        def notmodified():
+            return bottle.HTTPResponse(status=304)
+
+    def test_static_headers(self):
+        self.assertHeader('X-Frame-Options', 'DENY')
+        self.assertHeader('X-Static', touni('äöü').encode('utf8').decode('latin1'))
+        self.assertHeader('Content-Type', 'text/html; charset=UTF-8')
+        self.assertHeader('X-Frame-Options', 'SAMEORIGIN', '/override')
+        self.assertHeader('Content-Type', 'text/plain', '/override')
+        self.assertHeader('X-Frame-Options', 'DENY', '/notfound')
+
+    def test_static_content_type(self):
+        self.app.config['response.headers.content_type'] = 'application/json'
+        self.app.config['response.headers.x_later'] = 'later'
+        self.assertHeader('Content-Type', 'application/json')
+        self.assertHeader('X-Later', 'later')
+        self.assertHeader('Content-Type', 'text/plain', '/override')
+        self.assertHeader('Content-Type', None, '/notmodified')
+        self.assertHeader('X-Frame-Options', 'DENY', '/notmodified')
+
+    def test_static_content_type_error_page(self):
+        """ Static Content-Type headers do not apply to HTML error pages. """
+        self.app.config['response.headers.content_type'] = 'application/json'
+        self.app.route('/error', callback=lambda: 1 / 0)
+        @self.app.route('/abort')
+        def abort():
+            raise bottle.HTTPError(403, 'x', content_type='text/plain')
+        self.assertStatus(404, '/notfound')
+        self.assertHeader('Content-Type', 'text/html; charset=UTF-8', '/notfound')
+        self.assertStatus(500, '/error')
+        self.assertHeader('Content-Type', 'text/html; charset=UTF-8', '/error')
+        self.assertHeader('Content-Type', 'text/plain', '/abort')
+        self.app.error(404)(lambda e: '{}')
+        self.assertHeader('Content-Type', 'application/json', '/notfound')
+
+    def test_change_static_headers(self):
+        self.app.config['response.headers.x_frame_options'] = 'SAMEORIGIN'
+        self.assertHeader('X-Frame-Options', 'SAMEORIGIN')
+        del self.app.config['response.headers.x_frame_options']
+        self.assertHeader('X-Frame-Options', None)
+        self.assertHeader('X-Static', touni('äöü').encode('utf8').decode('latin1'))
+
+    def test_static_headers_not_in_response_headers(self):
+        """ Static headers are only added to the WSGI header list. """
+        @self.app.route('/inspect')
+        def inspect():
+            return str('X-Frame-Options' in bottle.response.headers)
+        self.assertBody('False', '/inspect')
+
+
+class TestFrozenResponse(ServerTestBase):
+    def test_reuse(self):
+        proto = HTTPResponse('frozen', status=202, x_test='a').freeze()
+        self.app.route('/', callback=lambda: proto)
+        for i in range(3):
+            self.assertStatus(202)
+            self.assertBody('frozen')
+            self.assertHeader('X-Test', 'a')
+            self.assertHeader('Content-Length', '6')
+        self.assertEqual(['X-Test'], list(proto.headers))
+        self.assertEqual(tob('frozen'), proto.body)
+
+    def test_raise(self):
+        proto = HTTPResponse(status=304, etag='abc').freeze()
+        @self.app.route('/')
+        def test():
+            bottle.response.set_header('X-Discarded', 'yes')
+            raise proto
+        self.assertStatus(304)
+        self.assertHeader('Etag', 'abc')
+        self.assertHeader('X-Discarded', None)
+        self.assertHeader('Content-Type', None)
+
+    def test_read_only_headers(self):
+        proto = HTTPResponse(status=304, etag='abc').freeze()
+        self.assertRaises(TypeError, proto.set_header, 'Etag', 'x')
+        self.assertRaises(TypeError, proto.__setitem__, 'X-Test', 'x')
+        self.assertRaises(AttributeError, proto.add_header, 'Etag', 'x')
+        with open(__file__, 'rb') as fp:
+            self.assertRaises(TypeError, HTTPResponse(fp).freeze)
+
+    def test_original_unchanged(self):
+        orig = HTTPResponse('body', x_test='a')
+        proto = orig.freeze()
+        orig.set_header('X-Test', 'b')
+        self.app.route('/', callback=lambda: proto)
+        self.assertHeader('X-Test', 'a')
+        self.assertEqual('body', orig.body)
+
+    def test_json_and_charset(self):
+        json = HTTPResponse({'error': 'ä'}, status=400).freeze()
+        latin1 = HTTPResponse('ä', content_type='text/plain; charset=latin1').freeze()
+        self.app.route('/json', callback=lambda: json)
+        self.app.route('/latin1', callback=lambda: latin1)
+        self.assertStatus(400, '/json')
+        self.assertHeader('Content-Type', 'application/json', '/json')
+        self.assertEqual({'error': touni('ä')},
+                         bottle.json_loads(self.urlopen('/json')['body']))
+        self.assertBody(touni('ä').encode('latin1'), '/latin1')
+        self.assertHeader('Content-Type', 'text/plain; charset=latin1', '/latin1')
+
+    def test_cookies(self):
+        res = HTTPResponse('')
+        res.set_cookie('a', 'b')
+        res.add_header('Set-Cookie', 'c=d')
+        proto = res.freeze()
+        self.app.route('/', callback=lambda: proto)
+        self.assertHeader('Set-Cookie', 'c=d, a=b')
+
+    def test_error(self):
+        proto = bottle.HTTPError(403, 'Go away', x_test='a').freeze()
+        self.app.route('/', callback=lambda: proto)
+        self.app.error(403)(lambda e: 'Error: %s' % e.body)
+        self.assertStatus(403)
+        self.assertBody('Error: Go away')
+        self.assertHeader('X-Test', 'a')
+
+    def test_hooks(self):
+        proto = HTTPResponse('', x_a='frozen').freeze()
+        self.app.route('/', callback=lambda: proto)
+        @self.app.hook('after_request')
+        def hook():
+            bottle.response.set_header('X-B', 'hook')
+        self.assertHeader('X-A', 'frozen')
+        self.assertHeader('X-B', 'hook')
+
+    def test_static_headers(self):
+        """ Frozen headers take precedence over static application headers. """
+        self.app.config['response.headers.x_a'] = 'app'
+        self.app.config['response.headers.x_b'] = 'app'
+        proto = HTTPResponse('', x_a='frozen').freeze()
+        self.app.route('/', callback=lambda: proto)
+        self.assertHeader('X-A', 'frozen')
+        self.assertHeader('X-B', 'app')
+
+
 class TestErrorHandling(ServerTestBase):
     def test_error_routing(self):
 
@@ -292,6 +445,60 @@ class TestRouteDecorator(ServerTestBase):
         self.assertBody('ok', '/test', method='POST')
         self.assertStatus(405, '/test', method='PUT')
 
+    def test_host(self):
+        @bottle.route('/', host='a.example.com')
+        def a(): return 'a'
+        @bottle.route('/', host='*.example.com')
+        def b(): return 'b'
+        @bottle.route('/', host='[::1]')
+        def c(): return 'c'
+        @bottle.route('/')
+        @bottle.route('/shared')
+        def d(): return 'd'
+        self.assertBody('a', '/', env={'HTTP_HOST': 'a.example.com'})
+        self.assertBody('a', '/', env={'HTTP_HOST': 'A.Example.com.:8080'})
+        self.assertBody('b', '/', env={'HTTP_HOST': 'b.example.com'})
+        self.assertBody('b', '/', env={'HTTP_HOST': 'x.a.example.com'})
+        self.assertBody('c', '/', env={'HTTP_HOST': '[::1]:8080'})
+        self.assertBody('d', '/', env={'HTTP_HOST': 'example.com'})
+        self.assertBody('d', '/', env={'HTTP_HOST': 'localhost'})
+        self.assertBody('d', '/shared', env={'HTTP_HOST': 'a.example.com'})
+        self.assertStatus(405, '/', method='POST', env={'HTTP_HOST': 'a.example.com'})
+        self.assertRaises(ValueError, bottle.route('/', host='a.*.com'), a)
+
+    def test_host_fallback_wildcard(self):
+        @bottle.route('/a', host='a.example.com')
+        def a(): return 'a'
+        @bottle.route('/w', host='*.example.com')
+        def w(): return 'w'
+        @bottle.route('/w', host='*.com')
+        @bottle.route('/c', host='*.com')
+        def c(): return 'c'
+        self.assertBody('a', '/a', env={'HTTP_HOST': 'a.example.com'})
+        self.assertBody('w', '/w', env={'HTTP_HOST': 'a.example.com'})
+        self.assertBody('c', '/c', env={'HTTP_HOST': 'a.example.com'})
+        self.assertStatus(404, '/x', env={'HTTP_HOST': 'a.example.com'})
+
+    def test_host_fallback_method(self):
+        @bottle.route('/', host='a.example.com')
+        def a(): return 'a'
+        @bottle.route('/', method='PUT', host='*.example.com')
+        def w(): return 'w'
+        @bottle.route('/', method='POST')
+        def shared(): return 'shared'
+        env = {'HTTP_HOST': 'a.example.com'}
+        self.assertBody('shared', '/', method='POST', env=env)
+        self.assertBody('w', '/', method='PUT', env=env)
+        self.assertStatus(405, '/', method='DELETE', env=env)
+        self.assertHeader('Allow', 'GET,POST,PUT', '/', method='DELETE', env=env)
+
+    def test_host_routebuild(self):
+        @bottle.route('/a', host='a.example.com', name='x')
+        @bottle.route('/b', name='x')
+        def test(): return bottle.url('x')
+        self.assertBody('/a', '/a', env={'HTTP_HOST': 'a.example.com'})
+        self.assertBody('/b', '/b', env={'HTTP_HOST': 'b.example.com'})
+
     def test_apply(self):
         def revdec(func):
             def wrapper(*a, **ka):
@@ -333,6 +540,18 @@ class TestRouteDecorator(ServerTestBase):
         self.assertBody('before', '/test')
         self.assertHeader('X-Hook', 'after', '/test')
 
+    def test_hooks_added_later(self):
+        @bottle.route()
+        def test():
+            return bottle.request.environ.get('hooktest','nohooks')
+        self.assertBody('nohooks', '/test')
+        def hook():
+            bottle.request.environ['hooktest'] = 'before'
+        bottle.app().add_hook('before_request', hook)
+        self.assertBody('before', '/test')
+        bottle.app().remove_hook('before_request', hook)
+        self.assertBody('nohooks', '/test')
+
     def test_after_request_sees_HTTPError_response(self):
         """ Issue #671  """
         called = []
@@ -502,6 +721,8 @@ class TestDecorators(ServerTestBase):
         self.assertEqual('/app/a/xxx/c', bottle.url('named', b='xxx'))
         bottle.request.environ['SCRIPT_NAME'] = 'app/'
         self.assertEqual('/app/a/xxx/c', bottle.url('named', b='xxx'))
+        urls = bottle.app().get_urls('named', [{'b': 'x'}, {'b': 'y', 'q': 1}])
+        self.assertEqual(['/app/a/x/c', '/app/a/y/c?q=1'], urls)
 
     def test_autoroute(self):
         app = bottle.Bottle()